@@ -0,0 +1,337 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains benchmarks for the performance of the Blocky engine.
+
+Run this file to print the result of every benchmark.
+"""
+from __future__ import annotations
+import importlib
+import multiprocessing
+import time
+import tracemalloc
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import block
+from block import Block, generate_board
+from settings import COLOUR_LIST
+
+# The modules that a headless worker needs to run games.
+ENGINE_MODULES = ['block', 'goal', 'player', 'blocky']
+
+
+def _import_all(modules: List[str]) -> None:
+    """Import every module in <modules>.
+    """
+    for module in modules:
+        importlib.import_module(module)
+
+
+def time_worker_startup(modules: List[str], runs: int = 5) -> float:
+    """Return the least time, in seconds, over <runs> runs, taken to start a
+    fresh worker process and import <modules> in it.
+
+    Workers are started with the 'spawn' method, so nothing is inherited from
+    this process.
+    """
+    context = multiprocessing.get_context('spawn')
+    best = None
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            executor.submit(_import_all, modules).result()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def report_worker_startup() -> None:
+    """Print how long a worker takes to start with and without pygame.
+
+    The engine modules don't import pygame themselves, so the difference is
+    what every worker used to pay for it. On a machine with one CPU and
+    pygame 2.6.1, the best of three calls gave about 150-190 ms for the engine
+    only and 460-580 ms with pygame.
+    """
+    headless = time_worker_startup(ENGINE_MODULES)
+    with_pygame = time_worker_startup(ENGINE_MODULES + ['pygame'])
+
+    print(f'Worker startup, engine only: {headless * 1000:.1f} ms')
+    print(f'Worker startup, with pygame: {with_pygame * 1000:.1f} ms')
+
+
+def _best_time(function: Callable[[], None], runs: int) -> float:
+    """Return the least time, in seconds, that one of <runs> calls to
+    <function> took.
+    """
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def report_raster_crossover(max_depth: int = 8, size: int = 750,
+                            runs: int = 10) -> Optional[int]:
+    """Print how long drawing a board one square at a time and drawing it with
+    a single blit in raster.draw_board take, for boards of every depth up to
+    <max_depth>.
+
+    Return the smallest depth at which the single blit is faster, which is
+    the value raster.RASTER_MIN_DEPTH should have, or None if it never is.
+    """
+    import pygame
+    import raster
+
+    surface = pygame.Surface((size, size))
+    crossover = None
+    min_depth = raster.RASTER_MIN_DEPTH
+
+    for depth in range(1, max_depth + 1):
+        random.seed(depth)
+        board = generate_board(depth, size)
+
+        def by_square() -> None:
+            to_visit = [board]
+            while len(to_visit) > 0:
+                block = to_visit.pop()
+                if len(block.children) == 0:
+                    pygame.draw.rect(surface, block.colour,
+                                     (block.position[0], block.position[1],
+                                      block.size, block.size))
+                else:
+                    to_visit.extend(block.children)
+
+        def by_blit() -> None:
+            raster.RASTER_MIN_DEPTH = 0
+            raster.draw_board(surface, board)
+
+        square_time = _best_time(by_square, runs)
+        blit_time = _best_time(by_blit, runs)
+        print(f'Depth {depth}: {square_time * 1000:.2f} ms by square, '
+              f'{blit_time * 1000:.2f} ms by blit')
+
+        if crossover is None and blit_time < square_time:
+            crossover = depth
+
+    raster.RASTER_MIN_DEPTH = min_depth
+    return crossover
+
+
+class _DictBlock:
+    """A stand-in for a Block that keeps its attributes in a __dict__, as
+    every Block did before Block had __slots__.
+    """
+
+    def __init__(self) -> None:
+        """Initialize a stand-in with the same attributes as a Block.
+        """
+        self.position = (0, 0)
+        self.size = 0
+        self.colour_index = None
+        self.level = 0
+        self.max_depth = 0
+        self.children = []
+        self._parent = None
+        self._histogram = None
+        self._move_counts = None
+        self._symmetry_hashes = None
+
+
+def _bytes_per_object(make: Callable[[], object], count: int) -> float:
+    """Return the average number of bytes allocated by each of <count> calls
+    to <make>, counting everything the objects hold on to.
+    """
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    objects = [make() for _ in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    # The list holding the objects isn't part of them.
+    return (used - objects.__sizeof__()) / count
+
+
+def report_node_memory(count: int = 100000) -> None:
+    """Print how many bytes a Block takes, and how many it would take if it
+    kept its attributes in a __dict__.
+    """
+    slotted = _bytes_per_object(lambda: Block((0, 0), 0, None, 0, 0), count)
+    with_dict = _bytes_per_object(_DictBlock, count)
+
+    print(f'Bytes per node, with __slots__: {slotted:.0f}')
+    print(f'Bytes per node, with __dict__: {with_dict:.0f}')
+
+
+def _time_turns(max_depth: int, turns: int, candidates: int) \
+        -> Tuple[float, int, int]:
+    """Return the time per turn, in seconds, and the number of Blocks newly
+    allocated and reused, over <turns> turns on a board of <max_depth>.
+
+    In each turn a RandomPlayer makes a move, and a SmartPlayer scores
+    <candidates> moves picked at random from the whole board, each on its own
+    copy of the board. Everything is drawn from a GameStreams for seed 0, so
+    every call makes the same moves.
+    """
+    from goal import BlobGoal
+    from player import RandomPlayer, SmartPlayer, _do_action, _sample_move
+    from streams import GameStreams
+
+    streams = GameStreams(0)
+    board = generate_board(max_depth, 750, rng=streams.board)
+    board.track_colours()
+    board.track_moves()
+    goal = BlobGoal(COLOUR_LIST[0])
+    mover = RandomPlayer(0, goal, streams.player(0))
+    scorer = SmartPlayer(1, goal, 1, streams.player(1))
+    picks = streams.stream('candidates')
+    counts = block.block_counts()
+
+    start = time.perf_counter()
+    for _ in range(turns):
+        for _ in range(candidates):
+            index = picks.randrange(board.move_count(goal.colour))
+            scorer._score_move(board, _sample_move(board, goal.colour, index))
+
+        mover.proceed()
+        move = mover.generate_move(board)
+        _do_action(move[2], (move[0], move[1]), goal.colour, streams.smashes)
+    elapsed = time.perf_counter() - start
+
+    after = block.block_counts()
+    return (elapsed / turns, after['allocated'] - counts['allocated'],
+            after['reused'] - counts['reused'])
+
+
+def report_turn_allocations(max_depth: int = 6, turns: int = 50,
+                            candidates: int = 20) -> None:
+    """Print the time per turn and the number of Blocks allocated per turn,
+    as measured by _time_turns, with released Blocks reused and without.
+
+    The moves are the same both ways, since reusing Blocks doesn't change
+    which random numbers are drawn.
+    """
+    max_free = block.MAX_FREE_BLOCKS
+    block.MAX_FREE_BLOCKS = 0
+    block.clear_free_blocks()
+    try:
+        without = _time_turns(max_depth, turns, candidates)
+    finally:
+        block.MAX_FREE_BLOCKS = max_free
+    with_reuse = _time_turns(max_depth, turns, candidates)
+    block.clear_free_blocks()
+
+    for name, result in [('without reuse', without),
+                         ('with reuse', with_reuse)]:
+        print(f'Turn {name}: {result[0] * 1000:.1f} ms, '
+              f'{result[1] / turns:.0f} Blocks allocated and '
+              f'{result[2] / turns:.0f} reused per turn')
+
+
+def _full_board(max_depth: int) -> Block:
+    """Return a board of <max_depth> with every leaf at max_depth.
+    """
+    random.seed(0)
+    board = Block((0, 0), 750, COLOUR_LIST[0], 0, max_depth)
+    # Each smashed Block's new children are visited right after it.
+    for node in board.preorder():
+        node.smash()
+
+    return board
+
+
+def _recursive_count(node: Block) -> int:
+    """Return the number of Blocks in the subtree of <node>, by recursion.
+    """
+    return 1 + sum(_recursive_count(child) for child in node.children)
+
+
+def report_traversal(max_depth: int = 6, runs: int = 5) -> None:
+    """Print the time per Block taken to walk a full board of <max_depth>
+    by recursion and with each of Block's traversal iterators, and by the
+    operations built on them.
+    """
+    from goal import _flatten
+
+    board = _full_board(max_depth)
+    copy = board.create_copy()
+    count = _recursive_count(board)
+
+    def walk(nodes: Callable[[], Iterator[Block]]) -> Callable[[], None]:
+        def run() -> None:
+            for _ in nodes():
+                pass
+        return run
+
+    timings = [
+        ('recursive walk', lambda: _recursive_count(board)),
+        ('preorder', walk(board.preorder)),
+        ('postorder', walk(board.postorder)),
+        ('leaves', walk(board.leaves)),
+        ('create_copy', board.create_copy),
+        ('==', lambda: board == copy),
+        ('str', lambda: str(board)),
+        ('goal._flatten', lambda: _flatten(board))
+    ]
+    for name, function in timings:
+        elapsed = _best_time(function, runs)
+        print(f'{name}: {elapsed / count * 1e9:.0f} ns per Block')
+
+
+def report_blob_scoring(max_depth: int = 11, runs: int = 3) -> None:
+    """Print how long blobs.largest_blobs takes to find the largest blobs
+    on a board of <max_depth>, with each number of workers up to the number
+    of CPUs, and at least 2 so that the cost of the worker processes shows
+    on a machine with one CPU. The best of <runs> runs is taken, so starting
+    the pool, which is kept between calls, isn't counted.
+    """
+    import os
+    from blobs import largest_blobs
+    from goal import _flatten_indices
+
+    random.seed(0)
+    flattened = _flatten_indices(generate_board(max_depth, 750))
+    workers = 1
+    while workers <= max(2, os.cpu_count() or 1):
+        elapsed = _best_time(lambda: largest_blobs(flattened, workers), runs)
+        print(f'Blobs at depth {max_depth}, {workers} workers: '
+              f'{elapsed * 1000:.0f} ms')
+        workers *= 2
+
+
+if __name__ == '__main__':
+    report_worker_startup()
+    report_raster_crossover()
+    report_node_memory()
+    report_turn_allocations()
+    report_traversal()
+    report_blob_scoring()
@@ -0,0 +1,328 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains a way to find the largest blob of every colour on a huge
+board using several processes.
+
+The board, flattened into palette indices, is put in shared memory and split
+into strips of whole columns, one per worker process. Each worker reads its
+strip straight from shared memory and labels the blobs within it. Rather than
+one cell at a time, it works with runs: the stretches of cells of one colour
+down a column. A run is joined to every run of the same colour beside it in
+the previous column with a union-find structure.
+
+Each worker sends back the colour and size of each of its blobs, along with
+the runs in the first and last columns of its strip. A final union-find pass
+over those border runs then joins the blobs that cross from one strip into
+the next.
+
+The worker processes and the shared memory are kept from one call to the
+next, since starting processes takes longer than labelling a whole board in
+one. The processes are started with spawn rather than fork, so it is safe to
+call largest_blobs from a thread.
+"""
+from __future__ import annotations
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy
+
+# A run of cells of one colour down a column: the row of its first cell, the
+# row after its last cell, its colour and the key of the blob it belongs to.
+Run = Tuple[int, int, int, int]
+
+# The number of strips, each labelled by its own worker process, that
+# largest_blobs splits a board into unless it is told otherwise. With 1, the
+# whole board is labelled in the calling process. Splitting has only been
+# timed on a machine with one CPU, where it can't be faster, so raise this
+# only where benchmark.report_blob_scoring shows that it pays.
+BLOB_WORKERS = 1
+
+# The pool of worker processes and the shared memory that the board is put in
+# for them, kept between calls, or None before they are first needed. Only one
+# call at a time may use them.
+_shared = {'executor': None, 'workers': 0, 'memory': None}
+_shared_lock = threading.Lock()
+
+
+class _Blobs:
+    """Disjoint sets of cells, each with a colour and a number of cells.
+
+    Sets are named by keys, and the key of a set is the key of one of the runs
+    it was made from.
+    """
+    # === Private Attributes ===
+    # _parent:
+    #     The key that each key was merged into, or the key itself if it
+    #     names a whole set.
+    # _size:
+    #     The number of cells in the set named by each key that names a whole
+    #     set.
+    # _colour:
+    #     The palette index of the colour of every set.
+    _parent: Dict[int, int]
+    _size: Dict[int, int]
+    _colour: Dict[int, int]
+
+    def __init__(self) -> None:
+        """Initialize with no sets.
+        """
+        self._parent = {}
+        self._size = {}
+        self._colour = {}
+
+    def add(self, key: int, colour: int, size: int) -> None:
+        """Add a set named <key> of <size> cells of <colour>.
+        """
+        self._parent[key] = key
+        self._size[key] = size
+        self._colour[key] = colour
+
+    def find(self, key: int) -> int:
+        """Return the key that names the whole set that <key> is in.
+        """
+        parent = self._parent
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+
+        return key
+
+    def union(self, first: int, second: int) -> None:
+        """Merge the sets that <first> and <second> are in.
+        """
+        first = self.find(first)
+        second = self.find(second)
+        if first == second:
+            return
+
+        if self._size[first] < self._size[second]:
+            first, second = second, first
+        self._parent[second] = first
+        self._size[first] += self._size.pop(second)
+
+    def sizes(self) -> Dict[int, Tuple[int, int]]:
+        """Return the colour and the number of cells of every set, by the key
+        that names it.
+        """
+        return {key: (self._colour[key], size)
+                for key, size in self._size.items()}
+
+
+def _join(left: List[Run], right: List[Run], blobs: _Blobs) -> None:
+    """Merge the blobs of every pair of runs of the same colour, one in
+    <left> and one in <right>, that lie beside each other.
+
+    <left> and <right> are the runs of two neighbouring columns, in order
+    down each column.
+    """
+    i = 0
+    j = 0
+    while i < len(left) and j < len(right):
+        start, end, colour, key = left[i]
+        other_start, other_end, other_colour, other_key = right[j]
+
+        if colour == other_colour and \
+                max(start, other_start) < min(end, other_end):
+            blobs.union(key, other_key)
+
+        if end <= other_end:
+            i += 1
+        if other_end <= end:
+            j += 1
+
+
+def _column_runs(grid: numpy.ndarray, x: int) -> List[Run]:
+    """Return the runs of column <x> of <grid>, keyed by the index of their
+    first cell in the whole grid.
+    """
+    column = grid[x]
+    n = len(column)
+    starts = [0] + (numpy.flatnonzero(column[1:] != column[:-1]) + 1).tolist()
+    ends = starts[1:] + [n]
+    colours = column[starts].tolist()
+
+    return [(starts[i], ends[i], colours[i], x * n + starts[i])
+            for i in range(len(starts))]
+
+
+def _label_strip(grid: numpy.ndarray, start: int, end: int) \
+        -> Tuple[Dict[int, Tuple[int, int]], List[Run], List[Run]]:
+    """Return the blobs within columns <start> to <end> - 1 of <grid>, which
+    is indexed by column and then row.
+
+    The blobs are given by their colour and number of cells, by key, followed
+    by the runs of the first and the last column of the strip, each keyed by
+    the blob it belongs to.
+    """
+    blobs = _Blobs()
+    first = []
+    previous = []
+
+    for x in range(start, end):
+        runs = _column_runs(grid, x)
+        for run_start, run_end, colour, key in runs:
+            blobs.add(key, colour, run_end - run_start)
+        _join(previous, runs, blobs)
+
+        if x == start:
+            first = runs
+        previous = runs
+
+    def by_blob(runs: List[Run]) -> List[Run]:
+        return [(run_start, run_end, colour, blobs.find(key))
+                for run_start, run_end, colour, key in runs]
+
+    return blobs.sizes(), by_blob(first), by_blob(previous)
+
+
+def _label_shared_strip(name: str, n: int, start: int, end: int) \
+        -> Tuple[Dict[int, Tuple[int, int]], List[Run], List[Run]]:
+    """Return what _label_strip does for the <n> by <n> grid in the shared
+    memory called <name>.
+
+    This runs in a worker process.
+    """
+    memory = SharedMemory(name)
+    try:
+        grid = numpy.ndarray((n, n), dtype=numpy.uint8, buffer=memory.buf)
+        result = _label_strip(grid, start, end)
+        # The array must be gone before the shared memory can be closed.
+        del grid
+    finally:
+        memory.close()
+
+    return result
+
+
+def _pool(workers: int) -> Executor:
+    """Return the pool of <workers> worker processes kept between calls,
+    starting it if there isn't one of that size yet.
+    """
+    if _shared['executor'] is None or _shared['workers'] != workers:
+        if _shared['executor'] is not None:
+            _shared['executor'].shutdown()
+        _shared['executor'] = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn'))
+        _shared['workers'] = workers
+
+    return _shared['executor']
+
+
+def _shared_memory(size: int) -> SharedMemory:
+    """Return the shared memory kept between calls, replacing it with a
+    larger block if it has fewer than <size> bytes.
+    """
+    memory = _shared['memory']
+    if memory is None or memory.size < size:
+        if memory is not None:
+            memory.close()
+            memory.unlink()
+        _shared['memory'] = SharedMemory(create=True, size=size)
+
+    return _shared['memory']
+
+
+def shutdown() -> None:
+    """Stop the worker processes and free the shared memory kept between
+    calls to largest_blobs. They are made again if they are needed.
+
+    This is called when the interpreter exits.
+    """
+    with _shared_lock:
+        if _shared['executor'] is not None:
+            _shared['executor'].shutdown()
+        if _shared['memory'] is not None:
+            _shared['memory'].close()
+            _shared['memory'].unlink()
+        _shared['executor'] = None
+        _shared['workers'] = 0
+        _shared['memory'] = None
+
+
+atexit.register(shutdown)
+
+
+def largest_blobs(flattened: List[bytearray], workers: Optional[int] = None,
+                  executor: Optional[Executor] = None) -> Dict[int, int]:
+    """Return the size of the largest blob of every colour on the board that
+    was flattened into <flattened> by goal._flatten_indices, by palette
+    index.
+
+    The columns are split into <workers> strips, or BLOB_WORKERS if
+    <workers> is None, and each strip is labelled by its own task on
+    <executor>, or on a pool of that many processes kept between calls if
+    <executor> is None. With one strip, everything is done in this process.
+
+    Precondition: len(flattened) > 0
+    """
+    n = len(flattened)
+    if workers is None:
+        workers = BLOB_WORKERS
+    workers = max(1, min(workers, n))
+    bounds = [n * i // workers for i in range(workers + 1)]
+
+    if workers == 1:
+        grid = numpy.frombuffer(b''.join(flattened),
+                                dtype=numpy.uint8).reshape(n, n)
+        strips = [_label_strip(grid, 0, n)]
+    else:
+        with _shared_lock:
+            memory = _shared_memory(n * n)
+            for i in range(n):
+                memory.buf[i * n:(i + 1) * n] = flattened[i]
+
+            if executor is None:
+                executor = _pool(workers)
+            futures = [executor.submit(_label_shared_strip, memory.name, n,
+                                       bounds[i], bounds[i + 1])
+                       for i in range(workers)]
+            strips = [future.result() for future in futures]
+
+    blobs = _Blobs()
+    for sizes, _, _ in strips:
+        for key, (colour, size) in sizes.items():
+            blobs.add(key, colour, size)
+    for i in range(len(strips) - 1):
+        _join(strips[i][2], strips[i + 1][1], blobs)
+
+    largest = {}
+    for colour, size in blobs.sizes().values():
+        if size > largest.get(colour, 0):
+            largest[colour] = size
+
+    return largest
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', '__future__', 'atexit',
+            'multiprocessing', 'threading', 'concurrent.futures',
+            'multiprocessing.shared_memory', 'numpy'
+        ]
+    })
@@ -22,17 +22,132 @@ Misha Schwartz, and Jaisie Sin
 This file contains the Block class, the main data structure used in the game.
 """
 from __future__ import annotations
-from typing import Optional, Tuple, List
+from typing import Callable, Dict, Iterator, Optional, Tuple, List
 import random
 import math
 
 from settings import colour_name, COLOUR_LIST
 
+# Every colour that a Block has been given, which Blocks store as their index
+# in this list. It starts with the colours of COLOUR_LIST, in order, so the
+# index of one of those is its index in COLOUR_LIST, and other colours are
+# added the first time they are used.
+PALETTE = list(COLOUR_LIST)
+_PALETTE_INDICES = {colour: i for i, colour in enumerate(PALETTE)}
 
-def generate_board(max_depth: int, size: int) -> Block:
+
+# Blocks that are no longer part of any board, kept to be reused by smash and
+# create_copy instead of allocating new ones. Only Blocks given back by
+# Block.release are kept, as SmartPlayer does with the copies it scores. The
+# Blocks are shared by every board in the process; at most MAX_FREE_BLOCKS,
+# about 1.4 MB of them, are kept, and clear_free_blocks lets go of them all.
+# Set MAX_FREE_BLOCKS to 0 to turn reuse off.
+MAX_FREE_BLOCKS = 8192
+_free_blocks = []
+
+# The number of Blocks that smash and create_copy have newly allocated and
+# reused so far.
+_block_counts = {'allocated': 0, 'reused': 0}
+
+
+def clear_free_blocks() -> None:
+    """Let go of every released Block kept for reuse, so that the memory
+    they take can be freed.
+
+    The Blocks kept are shared by every board in this process, and stay until
+    they are reused or this is called.
+    """
+    _free_blocks.clear()
+
+
+def block_counts() -> Dict[str, int]:
+    """Return the number of Blocks that smash and create_copy have newly
+    allocated, and the number they have reused, so far.
+    """
+    return dict(_block_counts)
+
+
+def _new_block(position: Tuple[int, int], size: int,
+               colour_index: Optional[int], level: int,
+               max_depth: int) -> Block:
+    """Return a Block with no children and the given attributes, reusing a
+    released Block if there is one.
+    """
+    try:
+        block = _free_blocks.pop()
+    except IndexError:
+        _block_counts['allocated'] += 1
+        block = Block(position, size, None, level, max_depth)
+        block.colour_index = colour_index
+        return block
+
+    _block_counts['reused'] += 1
+    block.position = position
+    block.size = size
+    block.colour_index = colour_index
+    block.level = level
+    block.max_depth = max_depth
+    return block
+
+
+def palette_index(colour: Optional[Tuple[int, int, int]]) -> Optional[int]:
+    """Return the index of <colour> in PALETTE, adding it if it isn't there
+    yet, or None if <colour> is None.
+
+    >>> palette_index(COLOUR_LIST[2])
+    2
+    """
+    if colour is None:
+        return None
+
+    index = _PALETTE_INDICES.get(colour)
+    if index is None:
+        index = len(PALETTE)
+        PALETTE.append(colour)
+        _PALETTE_INDICES[colour] = index
+
+    return index
+
+# The eight symmetries of a square board, each given as the number of
+# clockwise quarter turns followed by whether the board is then mirrored left
+# to right. SYMMETRIES[0] leaves the board as it is.
+SYMMETRIES = [(0, False), (1, False), (2, False), (3, False),
+              (0, True), (1, True), (2, True), (3, True)]
+
+
+def _symmetry_order(turns: int, mirrored: bool) -> List[int]:
+    """Return a list L such that once the symmetry (<turns>, <mirrored>) has
+    been applied to a Block, its child at index i is the old child at index
+    L[i], with the symmetry applied to it as well.
+    """
+    order = [0, 1, 2, 3]
+    for _ in range(turns):
+        # A clockwise turn moves the upper-left child to the upper-right, and
+        # so on around the square.
+        order = [order[1], order[2], order[3], order[0]]
+    if mirrored:
+        order = [order[1], order[0], order[3], order[2]]
+
+    return order
+
+
+_SYMMETRY_ORDERS = [_symmetry_order(turns, mirrored)
+                    for turns, mirrored in SYMMETRIES]
+
+
+def generate_board(max_depth: int, size: int, seed: Optional[int] = None,
+                   lazy: bool = False,
+                   rng: Optional[random.Random] = None) -> Block:
     """Return a new game board with a depth of <max_depth> and dimensions of
     <size> by <size>.
 
+    If <seed> is None and <lazy> is False, the board is generated with <rng>,
+    or the random module if <rng> is None. Otherwise every subdivided Block
+    holds a seed for its own children, all derived from <seed>, or from a seed
+    drawn from <rng> if <seed> is None. The same <seed> then always gives the
+    same board, and if <lazy> is True, each Block's children are only
+    generated when they are first used.
+
     >>> board = generate_board(3, 750)
     >>> board.max_depth
     3
@@ -40,13 +155,99 @@ def generate_board(max_depth: int, size: int) -> Block:
     750
     >>> len(board.children) == 4
     True
+    >>> generate_board(12, 750, 5) == generate_board(12, 750, 5, True)
+    True
+    >>> generate_board(5, 750, rng=random.Random(1)) == \\
+    ...     generate_board(5, 750, rng=random.Random(1))
+    True
     """
-    board = Block((0, 0), size, random.choice(COLOUR_LIST), 0, max_depth)
-    board.smash()
+    if rng is None:
+        rng = random
+
+    if seed is None and not lazy:
+        board = Block((0, 0), size, rng.choice(COLOUR_LIST), 0, max_depth)
+        board.smash(rng)
+        return board
+
+    if seed is None:
+        seed = rng.getrandbits(64)
+    board = Block((0, 0), size, None, 0, max_depth)
+    board._defer_children(seed)
+
+    if not lazy:
+        to_visit = [board]
+        while len(to_visit) > 0:
+            to_visit.extend(to_visit.pop().children)
 
     return board
 
 
+def _smash_chance(level: int) -> float:
+    """Return the chance that a Block at <level> is smashed when a board is
+    generated.
+    """
+    return math.exp(-0.25 * level)
+
+
+def diff_boards(old: Block, new: Block) -> List[Tuple[List[int], Block,
+                                                      Block]]:
+    """Return the regions in which <old> and <new> differ, as a list of
+    tuples. Each tuple contains:
+    - the indices of the children to follow from the root to the region,
+    - the Block that covers the region in <old>,
+    - the Block that covers the region in <new>,
+    in that order.
+
+    Subtrees that are the same object, or have the same symmetry hash, are
+    skipped without being looked into, so after a move only the Blocks that
+    it changed are visited. When all four children of a Block differ, the
+    Block is given as a single region instead.
+
+    Precondition: <old> and <new> have the same position, size, level and
+    max_depth.
+
+    >>> old = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+    >>> old.set_children([Block((0, 0), 375, colour, 1, 2)
+    ...                   for colour in COLOUR_LIST[:4]])
+    >>> new = old.create_copy()
+    >>> new.children[2].smash()
+    True
+    >>> changes = diff_boards(old, new)
+    >>> [path for path, _, _ in changes]
+    [[2]]
+    >>> changes[0][1] is old.children[2] and changes[0][2] is new.children[2]
+    True
+    """
+    result = []
+    to_visit = [([], old, new)]
+
+    while len(to_visit) > 0:
+        path, old_block, new_block = to_visit.pop()
+
+        if old_block is new_block or \
+                old_block.symmetry_hashes()[0] == \
+                new_block.symmetry_hashes()[0]:
+            continue
+
+        if len(old_block.children) == 0 or len(new_block.children) == 0:
+            result.append((path, old_block, new_block))
+            continue
+
+        changed = [i for i in range(4)
+                   if old_block.children[i] is not new_block.children[i] and
+                   old_block.children[i].symmetry_hashes()[0] !=
+                   new_block.children[i].symmetry_hashes()[0]]
+
+        if len(changed) == 4:
+            result.append((path, old_block, new_block))
+        else:
+            for i in reversed(changed):
+                to_visit.append((path + [i], old_block.children[i],
+                                 new_block.children[i]))
+
+    return result
+
+
 class Block:
     """A square Block in the Blocky game, represented as a tree.
 
@@ -67,6 +268,10 @@ class Block:
     colour:
         If this block is not subdivided, <colour> stores its colour. Otherwise,
         <colour> is None.
+    colour_index:
+        The index of <colour> in PALETTE, or None if <colour> is None. This is
+        what is actually stored, and <colour> is looked up from it, so colours
+        are compared as ints.
     level:
         The level of this block within the overall block structure.
         The outermost block, corresponding to the root of the tree,
@@ -92,12 +297,54 @@ class Block:
         - its colour is not None.
     - level <= max_depth
     """
+    # === Private Attributes ===
+    # _parent:
+    #     The Block that has this Block as one of its children, or None if this
+    #     Block is the root of its tree.
+    # _histogram:
+    #     None unless colour tracking was turned on with track_colours().
+    #     Otherwise, _histogram[i] is the number of unit cells of colour
+    #     COLOUR_LIST[i] in this Block and its descendants.
+    # _move_counts:
+    #     None unless move tracking was turned on with track_moves().
+    #     Otherwise, counts of the Blocks in this Block and its descendants
+    #     that actions can be done to: _move_counts[0] counts those with
+    #     children, _move_counts[1] those that can be smashed,
+    #     _move_counts[2] those that can be combined, _move_counts[3 + i]
+    #     the leaves at max_depth of colour COLOUR_LIST[i], and the last
+    #     entry the leaves at max_depth of any other colour.
+    # _symmetry_hashes:
+    #     None if not computed since this Block or a descendant last changed.
+    #     Otherwise, _symmetry_hashes[s] is a hash of this Block's colours and
+    #     structure once SYMMETRIES[s] is applied to it.
+    # _seed:
+    #     None unless this Block is subdivided but its children haven't been
+    #     generated yet. Otherwise, the seed they will be generated from the
+    #     first time children is used, and until then children isn't set.
+    #
+    # == Representation Invariants concerning the private attributes ==
+    #     If this Block has children, each child's _parent is this Block.
+    #     If _histogram is not None, every descendant's _histogram is not None
+    #     and sum(_histogram) counts every unit cell whose colour is in
+    #     COLOUR_LIST.
+    #     If _move_counts is not None, neither is any descendant's.
+    #     If _symmetry_hashes is not None, neither is any descendant's.
+    #     If _seed is not None, colour_index, _histogram, _move_counts and
+    #     _symmetry_hashes are None.
+    __slots__ = ['position', 'size', 'colour_index', 'level', 'max_depth',
+                 'children', '_parent', '_histogram', '_move_counts',
+                 '_symmetry_hashes', '_seed']
     position: Tuple[int, int]
     size: int
-    colour: Optional[Tuple[int, int, int]]
+    colour_index: Optional[int]
     level: int
     max_depth: int
     children: List[Block]
+    _parent: Optional[Block]
+    _histogram: Optional[List[int]]
+    _move_counts: Optional[List[int]]
+    _symmetry_hashes: Optional[List[int]]
+    _seed: Optional[int]
 
     def __init__(self, position: Tuple[int, int], size: int,
                  colour: Optional[Tuple[int, int, int]], level: int,
@@ -113,10 +360,117 @@ class Block:
         """
         self.position = position
         self.size = size
-        self.colour = colour
+        self.colour_index = palette_index(colour)
         self.level = level
         self.max_depth = max_depth
         self.children = []
+        self._parent = None
+        self._histogram = None
+        self._move_counts = None
+        self._symmetry_hashes = None
+        self._seed = None
+
+    def __getattr__(self, name: str) -> object:
+        """Return the attribute <name> of this Block, which hasn't been set.
+
+        This is only called for attributes that aren't set, so it generates
+        the children of a Block that has only a seed for them.
+        """
+        if name == 'children' and self._seed is not None:
+            self._generate_children()
+            return self.children
+        raise AttributeError(name)
+
+    def _defer_children(self, seed: int) -> None:
+        """Make this leaf a Block whose children will be generated from <seed>
+        the first time they are used.
+
+        Precondition: this Block has no children and self.level < max_depth
+        """
+        self.colour_index = None
+        self._seed = seed
+        del self.children
+
+    def _generate_children(self) -> None:
+        """Generate the children of this Block from its seed.
+
+        Each child is smashed with the same chance as in smash, but instead of
+        being subdivided right away, it is given a seed of its own.
+        """
+        rng = random.Random(self._seed)
+        self._seed = None
+        self.children = []
+
+        pos = self._children_positions()
+        size = self._child_size()
+        for i in range(4):
+            child = _new_block(pos[i], size,
+                               palette_index(rng.choice(COLOUR_LIST)),
+                               self.level + 1, self.max_depth)
+            child._parent = self
+            self.children.append(child)
+
+        for child in self.children:
+            if rng.random() < _smash_chance(child.level) and \
+                    child.level < child.max_depth:
+                child._defer_children(rng.getrandbits(64))
+
+    @property
+    def colour(self) -> Optional[Tuple[int, int, int]]:
+        """The colour of this Block if it is not subdivided, otherwise None.
+        """
+        if self.colour_index is None:
+            return None
+        return PALETTE[self.colour_index]
+
+    @colour.setter
+    def colour(self, colour: Optional[Tuple[int, int, int]]) -> None:
+        self.colour_index = palette_index(colour)
+
+    def __getstate__(self) -> Dict[str, object]:
+        """Return the state of this Block to be pickled.
+
+        A colour that isn't in COLOUR_LIST may have a different index in
+        another process, so it is pickled as the colour itself.
+        """
+        # Children that haven't been generated are pickled as their seed.
+        state = {name: getattr(self, name) for name in Block.__slots__
+                 if name != 'children' or self._seed is None}
+        if self.colour_index is not None and \
+                self.colour_index >= len(COLOUR_LIST):
+            state['colour_index'] = self.colour
+        return state
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        """Restore this Block from the pickled <state>.
+        """
+        if isinstance(state['colour_index'], tuple):
+            state['colour_index'] = palette_index(state['colour_index'])
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def release(self) -> None:
+        """Give this Block and all its descendants back to be reused by later
+        smashes and copies.
+
+        Only call this on a Block that has been removed from its board, or on
+        a copy that is no longer needed, since none of these Blocks may be
+        used again afterwards.
+        """
+        to_release = [self]
+        while len(to_release) > 0:
+            block = to_release.pop()
+            if block._seed is None:
+                to_release.extend(block.children)
+
+            block.children = []
+            block._seed = None
+            block._parent = None
+            block._histogram = None
+            block._move_counts = None
+            block._symmetry_hashes = None
+            if len(_free_blocks) < MAX_FREE_BLOCKS:
+                _free_blocks.append(block)
 
     def __str__(self) -> str:
         """Return this Block in a string format.
@@ -125,43 +479,39 @@ class Block:
         >>> str(block)
         'Leaf: colour=Black, pos=(0, 0), size=750, level=0\\n'
         """
-        if len(self.children) == 0:
-            indents = '\t' * self.level
-            colour = colour_name(self.colour)
-            return f'{indents}Leaf: colour={colour}, pos={self.position}, ' \
-                   f'size={self.size}, level={self.level}\n'
-        else:
-            indents = '\t' * self.level
-            result = f'{indents}Parent: pos={self.position},' \
-                     f'size={self.size}, level={self.level}\n'
-
-            for child in self.children:
-                result += str(child)
+        lines = []
+        for block in self.preorder():
+            indents = '\t' * block.level
+            if len(block.children) == 0:
+                colour = colour_name(block.colour)
+                lines.append(f'{indents}Leaf: colour={colour}, '
+                             f'pos={block.position}, size={block.size}, '
+                             f'level={block.level}\n')
+            else:
+                lines.append(f'{indents}Parent: pos={block.position},'
+                             f'size={block.size}, level={block.level}\n')
 
-            return result
+        return ''.join(lines)
 
     def __eq__(self, other: Block) -> bool:
         """Return True iff this Block and all its descendents are equivalent to
         the <other> Block and all its descendents.
         """
-        if len(self.children) == 0 and len(other.children) == 0:
-            # Both self and other are leaves.
-            return self.position == other.position and \
-                   self.size == other.size and \
-                   self.colour == other.colour and \
-                   self.level == other.level and \
-                   self.max_depth == other.max_depth
-        elif len(self.children) != len(other.children):
-            # One of self or other is a leaf while the other is not.
-            return False
-        else:
-            # Both self and other have four children.
-            for i in range(4):
-                # The != operator also uses the __eq__ special method.
-                if self.children[i] != other.children[i]:
-                    return False
+        # Both trees are walked in the same order, so until they first
+        # differ in shape, each pair is a Block and its counterpart.
+        for block, other_block in zip(self.preorder(), other.preorder()):
+            if len(block.children) != len(other_block.children):
+                # One of them is a leaf while the other is not.
+                return False
+            elif len(block.children) == 0 and not (
+                    block.position == other_block.position and
+                    block.size == other_block.size and
+                    block.colour_index == other_block.colour_index and
+                    block.level == other_block.level and
+                    block.max_depth == other_block.max_depth):
+                return False
 
-            return True
+        return True
 
     def _child_size(self) -> int:
         """Return the size of this Block's children.
@@ -190,10 +540,515 @@ class Block:
         # TODO: Recheck
         self.position = position
 
-        if len(self.children) != 0:
-            positions = self._children_positions()
-            for i in range(4):
-                self.children[i]._update_children_positions(positions[i])
+        # Children that haven't been generated yet will be placed when they
+        # are.
+        for block in self.preorder(lambda b: b._seed is None):
+            if block._seed is None and len(block.children) != 0:
+                positions = block._children_positions()
+                for i in range(4):
+                    block.children[i].position = positions[i]
+
+    def set_children(self, children: List[Block]) -> None:
+        """Make <children> the children of this Block, in the same order, and
+        move them and their descendants to the positions that go with it.
+
+        This Block's colour is set to None.
+
+        Precondition: len(children) == 4 and each child is one level below
+        this Block, half its size and has the same max_depth.
+        """
+        self.colour_index = None
+        self.children = list(children)
+
+        positions = self._children_positions()
+        for i in range(4):
+            self.children[i]._parent = self
+            self.children[i]._update_children_positions(positions[i])
+
+    def preorder(self, expand: Optional[Callable[[Block], bool]] = None) \
+            -> Iterator[Block]:
+        """Yield this Block and its descendants, each Block before its
+        descendants and children in the order they are stored.
+
+        If <expand> is given, the descendants of a Block B are only yielded,
+        and B's children only looked at, if expand(B) is True. B's children
+        are only looked at once B has been yielded, so the loop over this
+        iterator may give B children, or take them away.
+
+        >>> block = Block((0, 0), 750, None, 0, 1)
+        >>> block.set_children([Block((0, 0), 375, colour, 1, 1)
+        ...                     for colour in COLOUR_LIST[:4]])
+        >>> [b.level for b in block.preorder()]
+        [0, 1, 1, 1, 1]
+        """
+        to_visit = [self]
+        while len(to_visit) > 0:
+            block = to_visit.pop()
+            yield block
+            if (expand is None or expand(block)) and len(block.children) > 0:
+                to_visit.extend(block.children[::-1])
+
+    def postorder(self, expand: Optional[Callable[[Block], bool]] = None) \
+            -> Iterator[Block]:
+        """Yield this Block and its descendants, each Block after its
+        descendants and children in the order they are stored.
+
+        If <expand> is given, the descendants of a Block B are only yielded,
+        and B's children only looked at, if expand(B) is True.
+
+        >>> block = Block((0, 0), 750, None, 0, 1)
+        >>> block.set_children([Block((0, 0), 375, colour, 1, 1)
+        ...                     for colour in COLOUR_LIST[:4]])
+        >>> [b.level for b in block.postorder()]
+        [1, 1, 1, 1, 0]
+        """
+        # A None in to_visit stands for the last Block in expanded, whose
+        # children have all been yielded once it is reached.
+        to_visit = [self]
+        expanded = []
+        while len(to_visit) > 0:
+            block = to_visit.pop()
+            if block is None:
+                yield expanded.pop()
+            elif (expand is not None and not expand(block)) or \
+                    len(block.children) == 0:
+                yield block
+            else:
+                expanded.append(block)
+                to_visit.append(None)
+                to_visit.extend(block.children[::-1])
+
+    def leaves(self) -> Iterator[Block]:
+        """Yield every Block with no children in this Block's subtree, in
+        the order preorder() yields them.
+        """
+        for block in self.preorder():
+            if len(block.children) == 0:
+                yield block
+
+    def leaf_cells(self) -> Iterator[Tuple[Block, int, int, int]]:
+        """Yield every Block with no children in this Block's subtree, along
+        with the column and the row of its upper-left unit cell, counted from
+        the upper-left corner of this Block, and its width in unit cells.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+        >>> [cells[1:] for cells in block.leaf_cells()]
+        [(0, 0, 4)]
+        """
+        # Each entry is a Block and the column and row of its upper-left cell.
+        to_visit = [(self, 0, 0)]
+        while len(to_visit) > 0:
+            block, x, y = to_visit.pop()
+            cells = 2 ** (self.max_depth - block.level)
+
+            if len(block.children) == 0:
+                yield block, x, y, cells
+            else:
+                half = cells // 2
+                to_visit.append((block.children[3], x + half, y + half))
+                to_visit.append((block.children[2], x, y + half))
+                to_visit.append((block.children[1], x, y))
+                to_visit.append((block.children[0], x + half, y))
+
+    def path_from(self, ancestor: Block) -> List[int]:
+        """Return the indices of the children to follow from <ancestor> to
+        reach this Block.
+
+        The path is found by going up from this Block to <ancestor>, so it
+        doesn't depend on the positions of the Blocks along the way, which
+        rounding can push outside their parents on deep boards.
+
+        Precondition: <ancestor> is this Block or one of its ancestors.
+
+        >>> block = Block((0, 0), 750, None, 0, 1)
+        >>> block.set_children([Block((0, 0), 375, colour, 1, 1)
+        ...                     for colour in COLOUR_LIST[:4]])
+        >>> block.children[2].path_from(block)
+        [2]
+        """
+        path = []
+        block = self
+        while block is not ancestor:
+            parent = block._parent
+            # Blocks are compared by identity, since == compares structure.
+            for i in range(len(parent.children)):
+                if parent.children[i] is block:
+                    path.append(i)
+                    break
+            block = parent
+
+        path.reverse()
+        return path
+
+    def colour_columns(self) -> List[bytearray]:
+        """Return this Block as columns of unit cells, where the j-th entry of
+        column i is the index in PALETTE of the colour of the unit cell at
+        column i and row j.
+
+        Precondition: every colour in this Block has an index below 256.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[1], 0, 1)
+        >>> [list(column) for column in block.colour_columns()]
+        [[1, 1], [1, 1]]
+        """
+        n = 2 ** (self.max_depth - self.level)
+        result = [bytearray(n) for _ in range(n)]
+
+        for leaf, x, y, cells in self.leaf_cells():
+            run = bytes([leaf.colour_index]) * cells
+            for i in range(x, x + cells):
+                result[i][y:y + cells] = run
+
+        return result
+
+    def map_colours(self, function: Callable[[Tuple[int, int, int]],
+                                             Tuple[int, int, int]]) -> None:
+        """Replace the colour c of every Block with no children in this
+        Block's subtree with function(c).
+
+        Tracked colour and move counts, and symmetry hashes, are brought up
+        to date once for the whole subtree, rather than once per Block.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> block.map_colours(lambda colour: COLOUR_LIST[1])
+        >>> block.colour == COLOUR_LIST[1]
+        True
+        """
+        for block in self.postorder():
+            block._symmetry_hashes = None
+            if len(block.children) == 0:
+                block.colour_index = palette_index(function(block.colour))
+
+            if block is not self and block._histogram is not None:
+                if len(block.children) == 0:
+                    block._histogram = block._leaf_histogram()
+                else:
+                    block._histogram = [sum(counts) for counts in zip(
+                        *[child._histogram for child in block.children])]
+            if block is not self and block._move_counts is not None:
+                block._move_counts = block._sum_move_counts()
+
+        if self._parent is not None:
+            self._parent._forget_symmetry_hashes()
+        if self._histogram is not None:
+            if len(self.children) == 0:
+                self._set_histogram(self._leaf_histogram())
+            else:
+                self._set_histogram([sum(counts) for counts in zip(
+                    *[child._histogram for child in self.children])])
+        if self._move_counts is not None:
+            self._update_move_counts()
+
+    def _unit_cells(self) -> int:
+        """Return the number of unit cells covered by this Block.
+        """
+        return 4 ** (self.max_depth - self.level)
+
+    def _leaf_histogram(self) -> List[int]:
+        """Return the colour histogram of this Block as if it were a leaf of
+        its current colour.
+        """
+        histogram = [0] * len(COLOUR_LIST)
+
+        if self.colour_index < len(COLOUR_LIST):
+            histogram[self.colour_index] = self._unit_cells()
+
+        return histogram
+
+    def _set_histogram(self, histogram: List[int]) -> None:
+        """Replace this Block's colour histogram with <histogram> and apply the
+        difference to every ancestor, without visiting any other Block.
+
+        Precondition: colour tracking is turned on for this Block.
+        """
+        delta = [new - old for new, old in zip(histogram, self._histogram)]
+        self._histogram = histogram
+
+        ancestor = self._parent
+        while ancestor is not None and ancestor._histogram is not None:
+            for i in range(len(delta)):
+                ancestor._histogram[i] += delta[i]
+            ancestor = ancestor._parent
+
+    def track_colours(self) -> None:
+        """Turn on colour tracking for this Block and all its descendants.
+
+        Once tracking is on, every Block in the subtree keeps a count of its
+        unit cells per colour in COLOUR_LIST, and smash, paint, combine, swap
+        and rotate keep those counts up to date by only touching the Blocks
+        between the changed Block and the root.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+        >>> block.track_colours()
+        >>> block.colour_count(COLOUR_LIST[0])
+        16
+        """
+        for block in self.postorder():
+            if len(block.children) == 0:
+                block._histogram = block._leaf_histogram()
+            else:
+                histogram = [0] * len(COLOUR_LIST)
+                for child in block.children:
+                    child._parent = block
+                    for i in range(len(histogram)):
+                        histogram[i] += child._histogram[i]
+                block._histogram = histogram
+
+    def colour_count(self, colour: Tuple[int, int, int]) -> int:
+        """Return the number of unit cells of <colour> in this Block.
+
+        This is a constant time lookup once track_colours() has been called on
+        this Block or one of its ancestors.
+        """
+        index = _PALETTE_INDICES.get(colour)
+        if index is None or index >= len(COLOUR_LIST):
+            return 0
+        elif self._histogram is not None:
+            return self._histogram[index]
+        elif len(self.children) == 0:
+            return self._unit_cells() if self.colour_index == index else 0
+        else:
+            return sum(child.colour_count(colour) for child in self.children)
+
+    def dominant_colour(self) -> Optional[Tuple[int, int, int]]:
+        """Return the colour of the most unit cells in this Block, choosing the
+        one that comes first in COLOUR_LIST if there is a tie.
+
+        An undivided Block's dominant colour is its own colour. For any other
+        Block this takes constant time once colour tracking is on.
+
+        >>> block = Block((0, 0), 750, None, 0, 1)
+        >>> block.set_children([Block((0, 0), 375, COLOUR_LIST[1], 1, 1),
+        ...                     Block((0, 0), 375, COLOUR_LIST[0], 1, 1),
+        ...                     Block((0, 0), 375, COLOUR_LIST[1], 1, 1),
+        ...                     Block((0, 0), 375, COLOUR_LIST[2], 1, 1)])
+        >>> block.dominant_colour() == COLOUR_LIST[1]
+        True
+        """
+        if len(self.children) == 0:
+            return self.colour
+
+        counts = [self.colour_count(colour) for colour in COLOUR_LIST]
+        return COLOUR_LIST[counts.index(max(counts))]
+
+    def _own_move_counts(self) -> List[int]:
+        """Return the move counts, laid out as in _move_counts, of this Block
+        on its own, leaving out its descendants.
+        """
+        counts = [0] * (len(COLOUR_LIST) + 4)
+
+        if len(self.children) > 0:
+            counts[0] = 1
+            counts[2] = int(self.combinable())
+        elif self.level == self.max_depth:
+            if self.colour_index < len(COLOUR_LIST):
+                counts[3 + self.colour_index] = 1
+            else:
+                counts[-1] = 1
+        else:
+            counts[1] = 1
+
+        return counts
+
+    def _sum_move_counts(self) -> List[int]:
+        """Return the move counts of this Block and its descendants, from
+        those of its children.
+
+        Precondition: move tracking is turned on for this Block's children.
+        """
+        counts = self._own_move_counts()
+        for child in self.children:
+            for i in range(len(counts)):
+                counts[i] += child._move_counts[i]
+
+        return counts
+
+    def _update_move_counts(self) -> None:
+        """Recount the moves of this Block, once it has changed, and of every
+        ancestor, without visiting any other Block.
+
+        A parent is recounted as well as its counts changing, since whether it
+        can be combined depends on its children's colours.
+        """
+        block = self
+        while block is not None and block._move_counts is not None:
+            block._move_counts = block._sum_move_counts()
+            block = block._parent
+
+    def track_moves(self) -> None:
+        """Turn on move tracking for this Block and all its descendants.
+
+        Once tracking is on, every Block in the subtree keeps count of the
+        Blocks below it that each action can be done to, and smash, paint and
+        combine keep those counts up to date by only touching the Blocks
+        between the changed Block and the root. Rotating and swapping never
+        change them.
+        """
+        for block in self.postorder():
+            for child in block.children:
+                child._parent = block
+            block._move_counts = block._sum_move_counts()
+
+    def move_count(self, colour: Tuple[int, int, int]) -> int:
+        """Return the number of different moves other than PASS, as pairs of
+        a Block and an action, that can be done to this Block and its
+        descendants by a player who paints with <colour>.
+
+        Rotating clockwise, rotating counter-clockwise and the two swaps can
+        each be done to every Block with children. This takes time
+        proportional to the length of COLOUR_LIST once track_moves() has been
+        called on this Block or one of its ancestors.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 1)
+        >>> block.move_count(COLOUR_LIST[1])
+        1
+        >>> block.set_children([Block((0, 0), 375, colour, 1, 1)
+        ...                     for colour in COLOUR_LIST[:4]])
+        >>> block.move_count(COLOUR_LIST[1])
+        7
+        """
+        if self._move_counts is not None:
+            counts = self._move_counts
+            children = []
+        else:
+            counts = self._own_move_counts()
+            children = self.children
+
+        # Leaves that are already <colour> can't be painted
+        total = 4 * counts[0] + counts[1] + counts[2] + sum(counts[3:])
+        index = _PALETTE_INDICES.get(colour)
+        if index is not None and index < len(COLOUR_LIST):
+            total -= counts[3 + index]
+
+        return total + sum(child.move_count(colour) for child in children)
+
+    def _move_count_indices(self, action_name: str,
+                            colour: Optional[Tuple[int, int, int]]) \
+            -> List[int]:
+        """Return the indices in _move_counts of the counts of Blocks that the
+        action called <action_name> can be done to, painting with <colour>.
+        """
+        if action_name in ['rotate', 'swap']:
+            return [0]
+        elif action_name == 'smash':
+            return [1]
+        elif action_name == 'combine':
+            return [2]
+        elif action_name == 'paint':
+            index = _PALETTE_INDICES.get(colour)
+            return [3 + i for i in range(len(COLOUR_LIST))
+                    if i != index] + [len(COLOUR_LIST) + 3]
+        return []
+
+    def movable_blocks(self, action_name: str,
+                       colour: Optional[Tuple[int, int, int]] = None) \
+            -> List[Block]:
+        """Return every Block in this Block's subtree that the action called
+        <action_name> can be done to, painting with <colour>, in the order
+        they are met going down from this Block.
+
+        <action_name> is the first element of an action from the actions
+        module, such as 'smash'. Once track_moves() has been called, subtrees
+        with no such Blocks are skipped using the move counts, so finding
+        them takes time proportional to how many there are times the depth,
+        rather than to the size of the subtree.
+
+        >>> block = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+        >>> block.track_moves()
+        >>> block.movable_blocks('smash') == [block]
+        True
+        >>> block.movable_blocks('paint', COLOUR_LIST[1])
+        []
+        """
+        indices = self._move_count_indices(action_name, colour)
+        result = []
+        to_visit = [self]
+
+        while len(to_visit) > 0:
+            block = to_visit.pop()
+            if block._move_counts is not None and \
+                    sum(block._move_counts[i] for i in indices) == 0:
+                continue
+
+            own = block._own_move_counts()
+            if sum(own[i] for i in indices) > 0:
+                result.append(block)
+            to_visit.extend(reversed(block.children))
+
+        return result
+
+    def _forget_symmetry_hashes(self) -> None:
+        """Forget the symmetry hashes of this Block and its ancestors, which
+        are out of date once this Block has changed.
+        """
+        block = self
+        while block is not None and block._symmetry_hashes is not None:
+            block._symmetry_hashes = None
+            block = block._parent
+
+    def symmetry_hashes(self) -> List[int]:
+        """Return a list L where L[s] is a hash of the colours and structure
+        of this Block once SYMMETRIES[s] is applied to it.
+
+        Nothing is copied or moved: each Block's eight hashes are made from
+        its children's, and are kept until something below it changes, so
+        after a move only the Blocks between the move and the root are
+        rehashed. The hashes ignore position and size.
+        """
+        # Blocks whose hashes are known are yielded, but not looked into.
+        for block in self.postorder(lambda b: b._symmetry_hashes is None):
+            if block._symmetry_hashes is not None:
+                continue
+            elif len(block.children) == 0:
+                block._symmetry_hashes = [hash(block.colour_index)] * \
+                    len(SYMMETRIES)
+            else:
+                child_hashes = [child._symmetry_hashes
+                                for child in block.children]
+                block._symmetry_hashes = [
+                    hash(tuple(child_hashes[i][s] for i in order))
+                    for s, order in enumerate(_SYMMETRY_ORDERS)]
+
+        return self._symmetry_hashes
+
+    def canonical_key(self) -> Tuple[Tuple[int, int], int]:
+        """Return a key that is shared by this Block and every Block that can
+        be made from it by rotating the whole board and mirroring it, along
+        with the index in SYMMETRIES of the symmetry that turns this Block
+        into the canonical one.
+
+        Since PerimeterGoal and BlobGoal scores don't change under these
+        symmetries, the key can stand in for the board in score caches and
+        transposition tables. Unequal boards get the same key only if their
+        hashes collide.
+
+        >>> board = generate_board(3, 750)
+        >>> turned = board.create_copy()
+        >>> _ = turned.rotate(1)
+        >>> board.canonical_key()[0] == turned.canonical_key()[0]
+        True
+        """
+        hashes = self.symmetry_hashes()
+        lowest = min(hashes)
+
+        return (self.max_depth - self.level, lowest), hashes.index(lowest)
+
+    def apply_symmetry(self, symmetry: int) -> None:
+        """Turn this Block and all its descendants into their image under
+        SYMMETRIES[<symmetry>].
+
+        Mirroring is done by swapping horizontally at every level.
+        """
+        turns, mirrored = SYMMETRIES[symmetry]
+
+        for _ in range(turns):
+            self.rotate(1)
+        if mirrored:
+            to_mirror = [self]
+            while len(to_mirror) > 0:
+                block = to_mirror.pop()
+                if block.swap(0):
+                    to_mirror.extend(block.children)
 
     def smashable(self) -> bool:
         """Return True iff this block can be smashed.
@@ -203,9 +1058,19 @@ class Block:
         """
         return self.level != self.max_depth and len(self.children) == 0
 
-    def smash(self) -> bool:
+    def combinable(self) -> bool:
+        """Return True iff this block can be combined.
+
+        A block can be combined if its level is max_depth - 1, it has children
+        and one colour is held by more of its children than any other.
+        """
+        return len(self.children) > 0 and \
+            self.level == self.max_depth - 1 and \
+            self._majority_colour() is not None
+
+    def smash(self, rng: Optional[random.Random] = None) -> bool:
         """Sub-divide this block so that it has four randomly generated
-        children.
+        children, drawn from <rng>, or the random module if <rng> is None.
 
         If this Block's level is <max_depth>, do nothing. If this block has
         children, do nothing.
@@ -216,29 +1081,57 @@ class Block:
         result = False
 
         if self.smashable():
-            self.colour = None
-            # Calling the _children_positions() method that returns a
-            # tuple that defines the position of child blocks creates.
-            pos = self._children_positions()
-            size = self._child_size()
-            # The level should always be 1 greater than the
-            level = self.level + 1
-
-            for i in range(4):
-                child = Block(pos[i], size, random.choice(COLOUR_LIST),
-                              level, self.max_depth)
-                self.children.append(child)
-
+            self._forget_symmetry_hashes()
             result = True
-            # Did this because I want the code to test the IF condition
-            # in the FOR LOOP, if out of the children, if the condition is
-            # true, then smash the child further.
-
-            for child in self.children:
-                if random.random() < math.exp(-0.25 * child.level):
-                    child.smash()
+            if rng is None:
+                rng = random
+
+            # Each Block is given its children as soon as it is visited, so
+            # they are visited, and may be smashed in turn, before its next
+            # sibling is, which draws random numbers in the same order as
+            # smashing each child right after deciding to.
+            for block in self.preorder():
+                if block is self or \
+                        (rng.random() < _smash_chance(block.level) and
+                         block.smashable()):
+                    block._subdivide(rng)
+
+            # The new descendants are counted once the whole subtree has been
+            # generated, so that the recursive smashes above don't each walk
+            # up to the root.
+            if self._histogram is not None:
+                histogram = [0] * len(COLOUR_LIST)
+                for child in self.children:
+                    child.track_colours()
+                    for i in range(len(histogram)):
+                        histogram[i] += child._histogram[i]
+                self._set_histogram(histogram)
+            if self._move_counts is not None:
+                for child in self.children:
+                    child.track_moves()
+                self._update_move_counts()
         return result
 
+    def _subdivide(self, rng: random.Random) -> None:
+        """Give this Block four children of colours drawn from <rng>.
+
+        Precondition: this Block has no children and self.level < max_depth
+        """
+        self.colour_index = None
+        # Calling the _children_positions() method that returns a
+        # tuple that defines the position of child blocks creates.
+        pos = self._children_positions()
+        size = self._child_size()
+        # The level should always be 1 greater than the
+        level = self.level + 1
+
+        for i in range(4):
+            child = _new_block(pos[i], size,
+                               palette_index(rng.choice(COLOUR_LIST)),
+                               level, self.max_depth)
+            child._parent = self
+            self.children.append(child)
+
     def swap(self, direction: int) -> bool:
         """Swap the child Blocks of this Block.
 
@@ -258,6 +1151,7 @@ class Block:
             return False
 
         else:
+            self._forget_symmetry_hashes()
             # Order of positions: upper-right child, upper-left child,
             # lower-left child, lower-right child.
             if direction == 0:
@@ -298,6 +1192,8 @@ class Block:
             return False
 
         else:
+            # The children forget their own hashes as they rotate below.
+            self._forget_symmetry_hashes()
             child_positions = self._children_positions()
             upper_right = child_positions[0]
             upper_left = child_positions[1]
@@ -344,9 +1240,15 @@ class Block:
         Return True iff this Block's colour was changed.
         """
         # TODO: Recheck
+        index = palette_index(colour)
         if len(self.children) == 0 and self.level == self.max_depth and \
-                self.colour != colour:
-            self.colour = colour
+                self.colour_index != index:
+            self._forget_symmetry_hashes()
+            self.colour_index = index
+            if self._histogram is not None:
+                self._set_histogram(self._leaf_histogram())
+            if self._move_counts is not None:
+                self._update_move_counts()
             return True
         return False
 
@@ -367,29 +1269,44 @@ class Block:
         if len(self.children) == 0 or self.level != self.max_depth - 1:
             return False
 
+        to_pick = self._majority_colour()
+        if to_pick is None:
+            return False
+
+        self._forget_symmetry_hashes()
+        # The children aren't released for reuse, since a caller may still
+        # hold them. They are garbage collected once nothing else does.
+        self.children = []
+        self.colour = to_pick
+        if self._histogram is not None:
+            self._set_histogram(self._leaf_histogram())
+        if self._move_counts is not None:
+            self._update_move_counts()
+        return True
+
+    def _majority_colour(self) -> Optional[Tuple[int, int, int]]:
+        """Return the colour held by strictly more of this Block's unit cells
+        than any other colour, or None if there is a tie for the most.
+
+        Precondition: this Block has children.
+        """
+        if self._histogram is not None:
+            indices = range(len(COLOUR_LIST))
+            counts = self._histogram
         else:
-            colours = {}
+            indices = []
+            counts = []
             for child in self.children:
-                if child.colour in colours:
-                    colours[child.colour] += 1
+                if child.colour_index in indices:
+                    counts[indices.index(child.colour_index)] += 1
                 else:
-                    colours[child.colour] = 1
+                    indices.append(child.colour_index)
+                    counts.append(1)
 
-            # What if there are only two colours occupying two blocks each...
-            if len(colours) == 2 and 2 in colours.values():
-                return False
-
-            to_pick = list(colours.keys())[0]
-
-            for i in range(len(colours)):
-                key = list(colours.keys())[i]
-
-                if colours[key] > colours[to_pick]:
-                    to_pick = key
-
-            self.children = []
-            self.colour = to_pick
-            return True
+        most = max(counts)
+        if counts.count(most) > 1:
+            return None
+        return PALETTE[indices[counts.index(most)]]
 
     def create_copy(self) -> Block:
         """Return a new Block that is a deep copy of this Block.
@@ -397,33 +1314,39 @@ class Block:
         Remember that a deep copy has new blocks (not aliases) at every level.
         """
         # TODO: Recheck
-        if len(self.children) == 0:
-            position = ()
-            for i in self.position:
-                position = position + (i,)
-
-            colour = ()
-            for i in self.colour:
-                colour = colour + (i,)
-
-            copy = Block(position, self.size, colour, self.level,
-                         self.max_depth)
-
-            return copy
-
-        else:
-            position = ()
-            for i in self.position:
-                position = position + (i,)
-
-            # Assign none to colour (by RI) since it has children.
-            copy = Block(position, self.size, None, self.level,
-                         self.max_depth)
-
-            for child in self.children:
-                copy.children.append(child.create_copy())
+        # parents[i] is the copy of the last Block visited i levels below
+        # this one, which is the parent of the next Block visited i + 1 levels
+        # below it.
+        parents = []
+
+        # Children that haven't been generated will be generated the same way
+        # from the same seed, so there is no need to generate them now.
+        for block in self.preorder(lambda b: b._seed is None):
+            # Positions are immutable tuples, so they can be shared, and the
+            # colour is copied as its palette index.
+            copy = _new_block(block.position, block.size, block.colour_index,
+                              block.level, block.max_depth)
+            if block._seed is not None:
+                copy._defer_children(block._seed)
+            else:
+                if block._histogram is not None:
+                    copy._histogram = block._histogram.copy()
+                if block._move_counts is not None:
+                    copy._move_counts = block._move_counts.copy()
+                # The hashes are never changed in place, so they can be
+                # shared.
+                copy._symmetry_hashes = block._symmetry_hashes
+
+            depth = block.level - self.level
+            if depth > 0:
+                copy._parent = parents[depth - 1]
+                parents[depth - 1].children.append(copy)
+            if depth < len(parents):
+                parents[depth] = copy
+            else:
+                parents.append(copy)
 
-            return copy
+        return parents[0]
 
 
 if __name__ == '__main__':
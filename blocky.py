@@ -23,24 +23,42 @@ This file contains the different game states for the Blocky game.
 """
 
 from __future__ import annotations
-from typing import Dict, List, Optional, Tuple
-import pygame
+import random
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
 
-from actions import ACTION_MESSAGE, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE,\
-    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE, ACTION_PENALTY
+from actions import ACTION_MESSAGE, SMASH, PASS, PAINT, COMBINE, \
+    ACTION_PENALTY
 from block import Block
-from player import Player
-from renderer import Renderer
+from goal import score_goals
+from moves import encode, decode
+from player import Player, HumanPlayer, _do_action
 from settings import ANIMATION_DURATION
 
+# pygame and the renderer are only needed to show a game in a window, so they
+# are imported where they are used and the game logic can run without them.
+if TYPE_CHECKING:
+    import pygame
+    from renderer import Renderer
 
-def _block_to_squares(board: Block) -> List[Tuple[Tuple[int, int, int],
-                                                  Tuple[int, int], int]]:
+# Subdivided blocks that are at most this many pixels wide are drawn as a
+# single square of their dominant colour. Block._child_size rounds the
+# children of a 1 pixel block down to 0 pixels, so their detail can't be seen,
+# but the 1 pixel children of a 2 pixel block can.
+LOD_SIZE = 1
+
+
+def _block_to_squares(board: Block, min_size: int = 0) \
+        -> List[Tuple[Tuple[int, int, int], Tuple[int, int], int]]:
     """Return a list of tuples describing all of the squares to be drawn
     in order to render this Block.
 
     For every undivided Block, this includes one square in that Block's
-    colour. Each tuple contains:
+    colour. A Block that is at most <min_size> pixels wide is not looked into,
+    and gets one square in its dominant colour instead, so the number of
+    squares is bounded by the number of pixels rather than of Blocks. Each
+    tuple contains:
     - the colour of the block,
     - the (x, y) coordinates of the top left corner of the block,
     - the size of the block,
@@ -51,20 +69,56 @@ def _block_to_squares(board: Block) -> List[Tuple[Tuple[int, int, int],
     # TODO: Recheck
     result = []
 
-    n = len(board.children)
+    for block in board.preorder(lambda b: b.size > min_size):
+        if len(block.children) == 0:
+            to_add = (block.colour, block.position, block.size)
+            result.append(to_add)
 
-    if n == 0:
-        to_add = (board.colour, board.position, board.size)
-        result.append(to_add)
-
-    else:  # We automatically know n = 4 because of RI of block
-        for child in board.children:
-            child_squares = _block_to_squares(child)
-            result.extend(child_squares)
+        elif block.size <= min_size:
+            to_add = (block.dominant_colour(), block.position, block.size)
+            result.append(to_add)
 
     return result
 
 
+def _think(player: Player, board: Block) -> int:
+    """Return the move that <player> makes on <board>, encoded by
+    moves.encode so that it can be done on another copy of the board.
+    """
+    return encode(board, player.generate_move(board))
+
+
+def _start_thinking(player: Player, board: Block) -> Future:
+    """Return a Future for what _think returns for <player> and <board>,
+    worked out on a new thread.
+
+    The thread is a daemon, so quitting never waits for a search to finish.
+    A ThreadPoolExecutor's threads are waited for at exit even once it has
+    been shut down.
+    """
+    future = Future()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(_think(player, board))
+        except Exception as error:
+            # future.result() raises it again on the thread that asks.
+            future.set_exception(error)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def _ticks() -> int:
+    """Return the number of milliseconds since pygame was initialized.
+    """
+    import pygame
+
+    return pygame.time.get_ticks()
+
+
 class GameData:
     """
     A bundle of the data needed for a Blocky game.
@@ -82,20 +136,34 @@ class GameData:
         The number of combines done by each player.
     paints:
         The number of paints done by each player.
+    board_version:
+        The number of moves that have changed the board so far.
+    rng:
+        The generator that the blocks smashed by moves draw their children
+        from, or None to use the random module.
 
     === Representation Invariants ===
     - len(players) >= 1
     """
+    # === Private Attributes ===
+    # _goal_scores:
+    #   The goal scores worked out since the board last changed, keyed by
+    #   (board_version, type of goal, target colour) so that players with
+    #   the same kind of goal share an entry.
     max_turns: int
     board: Block
     players: List[Player]
     smashes: Dict[int, int]
     combines: Dict[int, int]
     paints: Dict[int, int]
+    board_version: int
+    rng: Optional[random.Random]
+    _goal_scores: Dict[Tuple[int, type, Tuple[int, int, int]], int]
 
-    def __init__(self, board: Block, players: List[Player]) -> None:
+    def __init__(self, board: Block, players: List[Player],
+                 rng: Optional[random.Random] = None) -> None:
         """Initialize the game data, saving a reference to <board> and
-        <players>.
+        <players>, with smashes drawn from <rng>.
 
         Precondition:
             - len(players) >= 1
@@ -103,6 +171,11 @@ class GameData:
         self.max_turns = 0
         self.board = board
         self.players = players
+        # Keep per-colour counts up to date so that the dominant colour of
+        # any subtree drawn with level of detail is a constant time lookup,
+        # and move counts so that random moves can be drawn without copying
+        board.track_colours()
+        board.track_moves()
 
         self.smashes = {}
         self.combines = {}
@@ -114,12 +187,38 @@ class GameData:
             self.combines[player.id] = 0
             self.paints[player.id] = 0
 
+        self.board_version = 0
+        self.rng = rng
+        self._goal_scores = {}
+
+    def _score_key(self, player: Player) \
+            -> Tuple[int, type, Tuple[int, int, int]]:
+        """Return the key under which <player>'s goal score on the current
+        board is cached.
+        """
+        return self.board_version, type(player.goal), player.goal.colour
+
     def calculate_score(self, player_id: int) -> Tuple[int, int]:
         """Return a tuple containing first the <player_id>'s score based on
         their goal in the game and second the deductions from their score based
         on the actions they've taken.
+
+        The goal scores of all players are worked out together the first time
+        one is asked for after the board changes, and reused until the next
+        change.
         """
-        goal_score = self.players[player_id].goal.score(self.board)
+        key = self._score_key(self.players[player_id])
+
+        if key not in self._goal_scores:
+            goals = {}
+            for player in self.players:
+                goals[self._score_key(player)] = player.goal
+
+            keys = list(goals.keys())
+            scores = score_goals([goals[k] for k in keys], self.board)
+            self._goal_scores.update(zip(keys, scores))
+
+        goal_score = self._goal_scores[key]
 
         penalty = self.smashes[player_id] * ACTION_PENALTY[SMASH] + \
                   self.combines[player_id] * ACTION_PENALTY[COMBINE] + \
@@ -127,6 +226,37 @@ class GameData:
 
         return goal_score, penalty
 
+    def apply_move(self, player: Player,
+                   move: Tuple[str, Optional[int], Block]) -> bool:
+        """Attempt to do <move> on behalf of <player>, counting it towards
+        <player>'s penalties if it is a smash, paint or combine.
+
+        Return True iff the move was performed. A PASS is always performed.
+
+        The move is done by player._do_action, the same rules that computer
+        players and the server use.
+        """
+        action = (move[0], move[1])
+        if action == PASS:
+            # Do nothing, and leave the cached scores as they are
+            return True
+
+        move_successful = _do_action(move[2], action, player.goal.colour,
+                                     self.rng)
+
+        if move_successful:
+            if action == SMASH:
+                self.smashes[player.id] += 1
+            elif action == PAINT:
+                self.paints[player.id] += 1
+            elif action == COMBINE:
+                self.combines[player.id] += 1
+
+            self.board_version += 1
+            self._goal_scores = {}
+
+        return move_successful
+
 
 class GameState:
     """One of the different states that a Blocky game can be in.
@@ -162,10 +292,15 @@ class MainState(GameState):
     #   The index of the current player in GameData.players.
     # _current_score:
     #   The score of the current player, including penalties.
+    # _thinking:
+    #   The move that the current computer player is generating on a copy of
+    #   the board, on its own thread so that the frame loop keeps running
+    #   while it does, or None if it isn't generating one.
     _turn: int
     _data: GameData
     _current_player_index: int
     _current_score: int
+    _thinking: Optional[Future]
 
     def __init__(self, data: GameData) -> None:
         """Initialize this GameState.
@@ -173,6 +308,7 @@ class MainState(GameState):
         self._turn = 0
         self._data = data
         self._current_player_index = 0
+        self._thinking = None
 
         score, penalty = self._data.calculate_score(self._current_player().id)
         self._current_score = score - penalty
@@ -197,28 +333,7 @@ class MainState(GameState):
     def _do_move(self, move: Tuple[str, Optional[int], Block]) -> bool:
         """Attempt to do the player's requested move.
         """
-        action = (move[0], move[1])
-        direction = move[1]
-        block = move[2]
-        player = self._current_player()
-        move_successful = False
-
-        if action in [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE]:
-            move_successful = block.rotate(direction)
-        elif action in [SWAP_HORIZONTAL, SWAP_VERTICAL]:
-            move_successful = block.swap(direction)
-        elif action == SMASH:
-            move_successful = block.smash()
-            self._data.smashes[player.id] += int(move_successful)
-        elif action == PAINT:
-            move_successful = block.paint(self._current_player().goal.colour)
-            self._data.paints[player.id] += int(move_successful)
-        elif action == COMBINE:
-            move_successful = block.combine()
-            self._data.combines[player.id] += int(move_successful)
-        elif action == PASS:
-            # Do nothing
-            move_successful = True
+        move_successful = self._data.apply_move(self._current_player(), move)
 
         if move_successful:
             self._update_player()
@@ -226,21 +341,63 @@ class MainState(GameState):
         return move_successful
 
     def process_event(self, event: pygame.event.Event) -> None:
+        import pygame
+
+        if event.type == pygame.QUIT:
+            self._stop_thinking()
         self._current_player().process_event(event)
 
+    def _stop_thinking(self) -> None:
+        """Stop waiting for the move the current computer player is
+        generating, if there is one.
+
+        A search that has already started finishes on its own thread, which
+        doesn't keep the program from exiting, and its move is ignored.
+        """
+        if self._thinking is not None:
+            self._thinking.cancel()
+            self._thinking = None
+
+    def _next_move(self) -> Optional[Tuple[str, Optional[int], Block]]:
+        """Return the move that the current player wants to make, or None if
+        the player hasn't settled on one yet.
+
+        Computer players generate their moves on the worker thread against a
+        copy of the board, and the resulting move is decoded against the real
+        board once it is ready.
+        """
+        player = self._current_player()
+        board = self._data.board
+
+        if isinstance(player, HumanPlayer):
+            return player.generate_move(board)
+
+        if self._thinking is None:
+            if player.ready_to_move():
+                self._thinking = _start_thinking(player, board.create_copy())
+            return None
+        elif not self._thinking.done():
+            return None
+
+        code = self._thinking.result()
+        self._thinking = None
+
+        return decode(board, code)
+
     def update(self) -> GameState:
         if self._turn >= self._data.max_turns:
+            self._stop_thinking()
             return GameOverState(self._data)
 
         # Ask the player to make a move
-        move = self._current_player().generate_move(self._data.board)
+        move = self._next_move()
 
         if move is None:
             # No move was made, stay in the current state
             return self
         else:
             # Save what the board looks like before the move
-            background = _block_to_squares(self._data.board)
+            background = _block_to_squares(self._data.board, LOD_SIZE)
             # Also save the current player ID
             player_id = self._current_player().id
 
@@ -253,7 +410,7 @@ class MainState(GameState):
                 return self
 
     def render(self, renderer: Renderer) -> None:
-        renderer.draw_board(_block_to_squares(self._data.board))
+        renderer.draw_board(_block_to_squares(self._data.board, LOD_SIZE))
 
         b = self._current_player().get_selected_block(self._data.board)
         if b is not None:
@@ -262,6 +419,8 @@ class MainState(GameState):
         p = self._current_player()
         status = f'Turn {self._turn} | Player {p.id} | ' \
                  f'Score {self._current_score} | {p.goal.description()}'
+        if self._thinking is not None:
+            status = f'{status} | Thinking...'
         renderer.draw_status(status)
 
 
@@ -296,13 +455,13 @@ class AnimateMoveState(GameState):
         self._player_id = player_id
         self._move = move
         self._background = background
-        self._start_time = pygame.time.get_ticks()
+        self._start_time = _ticks()
 
     def process_event(self, event: pygame.event.Event) -> None:
         return  # Ignore the event
 
     def update(self) -> GameState:
-        elapsed_seconds = (pygame.time.get_ticks() - self._start_time) / 1000
+        elapsed_seconds = (_ticks() - self._start_time) / 1000
 
         if elapsed_seconds > ANIMATION_DURATION:
             # The animation is complete, do the move, go back to the last
@@ -379,7 +538,8 @@ if __name__ == '__main__':
         'allowed-io': ['run_game'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'pygame', '__future__',
-            'block', 'player', 'renderer', 'settings', 'actions'
+            'concurrent.futures', 'block', 'goal', 'moves', 'player',
+            'renderer', 'settings', 'actions'
         ],
         'generated-members': 'pygame.*'
     })
@@ -0,0 +1,291 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains a pipeline that plays computer players against each other
+without a window and saves every move they make as a dataset.
+
+Each move becomes one record, holding the board before the move, the goal of
+the player who made it, the move itself with the path to the block it acted
+on, the player's goal score before and after, and the penalty it cost. Records
+are stored column by column in compressed NumPy .npz shards of a fixed number
+of records each, so a producer never holds more than one shard in memory.
+
+Games are played by several producer processes at once, each writing its own
+shards. read_shards and read_records go through a dataset one shard at a time,
+and only load the columns that are asked for.
+"""
+from __future__ import annotations
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy
+
+from actions import ACTION_PENALTY
+from block import generate_board
+from blocky import GameData
+from goal import PerimeterGoal, BlobGoal
+from moves import ACTIONS, block_path
+from player import create_players
+from raster import colour_grid
+from settings import COLOUR_LIST
+from streams import GameStreams
+
+# The kinds of goal, in the order of the numbers that stand for them in a
+# dataset. Actions are numbered by their index in moves.ACTIONS.
+GOALS = [PerimeterGoal, BlobGoal]
+
+# The columns of a dataset and the type of each. 'board' holds, for every
+# unit cell, the index of its colour in COLOUR_LIST, by column and then row,
+# as raster.colour_grid gives it. 'path' holds the child indices leading from
+# the root to the block that was acted on, padded with -1, and 'level' is the
+# number of them that are used.
+COLUMNS = {
+    'game': numpy.int64,
+    'turn': numpy.int32,
+    'player': numpy.int8,
+    'board': numpy.uint8,
+    'goal': numpy.int8,
+    'colour': numpy.int8,
+    'action': numpy.int8,
+    'path': numpy.int8,
+    'level': numpy.int8,
+    'score_before': numpy.int32,
+    'score_after': numpy.int32,
+    'penalty': numpy.int32
+}
+
+
+def play_game(seed: int, max_depth: int, max_turns: int, num_random: int,
+              smart_players: List[int]) -> Iterator[Dict[str, object]]:
+    """Play a game between <num_random> random players and one smart player
+    per difficulty in <smart_players>, on a board of <max_depth>, for
+    <max_turns> turns, and yield a record of every move made.
+
+    The board, the goals, every player's moves and every smash draw from
+    their own generators in a GameStreams for <seed>, so the same seed always
+    gives the same game, whichever process plays it and whatever else that
+    process has played before.
+    """
+    streams = GameStreams(seed)
+    board = generate_board(max_depth, 750, rng=streams.board)
+    players = create_players(0, num_random, smart_players, streams)
+    data = GameData(board, players, streams.smashes)
+
+    for turn in range(max_turns):
+        for player in players:
+            player.proceed()
+            move = player.generate_move(data.board)
+            action = (move[0], move[1])
+            path = block_path(data.board, move[2])
+            score_before = data.calculate_score(player.id)[0]
+
+            record = {
+                'game': seed,
+                'turn': turn,
+                'player': player.id,
+                'board': colour_grid(data.board)[0],
+                'goal': GOALS.index(type(player.goal)),
+                'colour': COLOUR_LIST.index(player.goal.colour),
+                'action': ACTIONS.index(action),
+                'path': path + [-1] * (max_depth - len(path)),
+                'level': len(path)
+            }
+
+            if not data.apply_move(player, move):
+                raise ValueError(f'Player {player.id} made an invalid move')
+
+            record['score_after'] = data.calculate_score(player.id)[0]
+            record['score_before'] = score_before
+            record['penalty'] = ACTION_PENALTY.get(action, 0)
+            yield record
+
+
+class ShardWriter:
+    """Writes records to a directory as .npz shards of a fixed size.
+
+    === Public Attributes ===
+    directory:
+        The directory that shards are written to.
+    prefix:
+        The start of the name of every shard this writer writes.
+    shard_size:
+        The number of records in every shard but the last.
+    shards:
+        The number of shards written so far.
+    """
+    # === Private Attributes ===
+    # _columns:
+    #   The records that haven't been written yet, column by column.
+    directory: str
+    prefix: str
+    shard_size: int
+    shards: int
+    _columns: Dict[str, list]
+
+    def __init__(self, directory: str, prefix: str, shard_size: int) -> None:
+        """Initialize a writer of shards of <shard_size> records, named
+        <prefix>_00000.npz, <prefix>_00001.npz and so on, in <directory>.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shards = 0
+        self._columns = {name: [] for name in COLUMNS}
+
+    def add(self, record: Dict[str, object]) -> None:
+        """Add <record>, writing out a shard once there are enough records.
+        """
+        for name in COLUMNS:
+            self._columns[name].append(record[name])
+
+        if len(self._columns['game']) >= self.shard_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write out the records that haven't been written yet, if any.
+
+        The shard is written under a temporary name and renamed once it is
+        complete, so a reader never sees part of one.
+        """
+        if len(self._columns['game']) == 0:
+            return
+
+        arrays = {name: numpy.array(values, dtype=COLUMNS[name])
+                  for name, values in self._columns.items()}
+        path = os.path.join(self.directory,
+                            f'{self.prefix}_{self.shards:05d}.npz')
+
+        with open(path + '.tmp', 'wb') as file:
+            numpy.savez_compressed(file, **arrays)
+        os.replace(path + '.tmp', path)
+
+        self.shards += 1
+        self._columns = {name: [] for name in COLUMNS}
+
+
+def _produce(directory: str, producer: int, seeds: List[int], max_depth: int,
+             max_turns: int, num_random: int, smart_players: List[int],
+             shard_size: int) -> int:
+    """Play one game per seed in <seeds> and write their records to shards in
+    <directory>, named after <producer>. Return the number of records written.
+
+    This runs in a producer process.
+    """
+    writer = ShardWriter(directory, f'shard_{producer:03d}', shard_size)
+    count = 0
+
+    for seed in seeds:
+        for record in play_game(seed, max_depth, max_turns, num_random,
+                                smart_players):
+            writer.add(record)
+            count += 1
+
+    writer.flush()
+    return count
+
+
+def generate_dataset(directory: str, games: int, max_depth: int = 4,
+                     max_turns: int = 10, num_random: int = 1,
+                     smart_players: Optional[List[int]] = None,
+                     shard_size: int = 4096, seed: int = 0,
+                     workers: Optional[int] = None) -> int:
+    """Play <games> games and write the records of all their moves to
+    <directory>. Return the number of records written.
+
+    Every game has <num_random> random players and one smart player per
+    difficulty in <smart_players>, and game i is played from the seed
+    <seed> + i. The games are shared out between <workers> producer
+    processes, or one per CPU if <workers> is None.
+    """
+    if smart_players is None:
+        smart_players = [2]
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    seeds = list(range(seed, seed + games))
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(_produce, directory, i, seeds[i::workers],
+                                   max_depth, max_turns, num_random,
+                                   smart_players, shard_size)
+                   for i in range(workers)]
+        return sum(future.result() for future in futures)
+
+
+def shard_paths(directory: str) -> List[str]:
+    """Return the paths of every complete shard in <directory>, in order.
+    """
+    return [os.path.join(directory, name)
+            for name in sorted(os.listdir(directory)) if name.endswith('.npz')]
+
+
+def read_shards(directory: str, columns: Optional[List[str]] = None) \
+        -> Iterator[Dict[str, numpy.ndarray]]:
+    """Yield the <columns> of each shard in <directory>, or all its columns if
+    <columns> is None, one shard at a time.
+
+    Columns that aren't asked for are never decompressed.
+    """
+    if columns is None:
+        columns = list(COLUMNS)
+
+    for path in shard_paths(directory):
+        with numpy.load(path) as shard:
+            yield {name: shard[name] for name in columns}
+
+
+def read_records(directory: str, columns: Optional[List[str]] = None) \
+        -> Iterator[Dict[str, numpy.ndarray]]:
+    """Yield the <columns> of every record in <directory>, or all its columns
+    if <columns> is None, one at a time.
+    """
+    for shard in read_shards(directory, columns):
+        names = list(shard)
+        for i in range(len(shard[names[0]])):
+            yield {name: shard[name][i] for name in names}
+
+
+def action_of(record: Dict[str, numpy.ndarray]) -> Tuple[str, Optional[int]]:
+    """Return the action that <record> holds.
+    """
+    return ACTIONS[int(record['action'])]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate Blocky games.')
+    parser.add_argument('directory')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--max-depth', type=int, default=4)
+    parser.add_argument('--max-turns', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shard-size', type=int, default=4096)
+    parser.add_argument('--workers', type=int,
+                        help='producer processes (default: CPUs)')
+    args = parser.parse_args()
+
+    total = generate_dataset(args.directory, args.games, args.max_depth,
+                             args.max_turns, shard_size=args.shard_size,
+                             seed=args.seed, workers=args.workers)
+    print(f'Wrote {total} records to {args.directory}')
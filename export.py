@@ -0,0 +1,268 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains tools to record games and export them as image frames.
+
+A GameRecord holds everything needed to play a game again move for move: the
+seed its board was generated from and the moves that were made. Smashes are
+random, so every move is done with a generator seeded for that move, both when
+the game is recorded and when it is replayed, which makes the replay exact.
+Nothing is drawn from the random module, so games can be recorded and
+replayed side by side.
+
+Replaying a record produces one frame per move, showing the board before the
+move with the block being acted on outlined, as AnimateMoveState shows it,
+followed by a frame of the final board. Frames are rasterised straight to
+arrays without a window, and can be written out as PNG files, encoded by a
+pool of worker processes, or as a stream of raw RGB frames.
+"""
+from __future__ import annotations
+import os
+import random
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import BinaryIO, Deque, Iterator, List, Optional, Tuple
+
+import numpy
+
+from block import Block, generate_board
+from blocky import GameData
+from goal import Goal
+from moves import encode, decode
+from player import Player, RandomPlayer
+from raster import board_pixels
+
+# The colour and width, in pixels, of the outline drawn around the block that
+# a move acts on.
+HIGHLIGHT_COLOUR = (255, 255, 255)
+HIGHLIGHT_WIDTH = 3
+
+
+class GameRecord:
+    """A game that can be played again exactly.
+
+    === Public Attributes ===
+    seed:
+        The seed that the board was generated from. The seed for move i is
+        seed + i + 1.
+    max_depth:
+        The max_depth of the board.
+    size:
+        The size of the board, in pixels.
+    goals:
+        The goal of each player, by player id.
+    moves:
+        The moves that were made, in order, each as the id of the player who
+        made it and the move encoded by moves.encode.
+    """
+    seed: int
+    max_depth: int
+    size: int
+    goals: List[Goal]
+    moves: List[Tuple[int, int]]
+
+    def __init__(self, seed: int, max_depth: int, size: int,
+                 goals: List[Goal]) -> None:
+        """Initialize a record of a game with no moves yet.
+        """
+        self.seed = seed
+        self.max_depth = max_depth
+        self.size = size
+        self.goals = goals
+        self.moves = []
+
+    def new_game(self) -> GameData:
+        """Return the game in the state it was in before any moves were made.
+
+        The players are stand-ins that only carry their goals.
+        """
+        board = generate_board(self.max_depth, self.size,
+                               rng=random.Random(self.seed))
+        players = [RandomPlayer(i, goal) for i, goal in enumerate(self.goals)]
+
+        return GameData(board, players)
+
+    def do_move(self, data: GameData, i: int,
+                move: Tuple[str, Optional[int], Block]) -> bool:
+        """Do <move>, the move numbered <i> in this record, in <data>.
+
+        Return True iff the move was done.
+        """
+        player_id = self.moves[i][0]
+        data.rng = random.Random(self.seed + i + 1)
+
+        return data.apply_move(data.players[player_id], move)
+
+
+def record_game(players: List[Player], max_depth: int, max_turns: int,
+                seed: int, size: int = 750) -> GameRecord:
+    """Play a game between the computer <players> without a window and return
+    its record.
+
+    Precondition: no player in <players> is a HumanPlayer.
+    """
+    record = GameRecord(seed, max_depth, size,
+                        [player.goal for player in players])
+    data = record.new_game()
+    data.players = players
+
+    for _ in range(max_turns):
+        for player in players:
+            player.proceed()
+            move = player.generate_move(data.board)
+            record.moves.append((player.id, encode(data.board, move)))
+
+            if not record.do_move(data, len(record.moves) - 1, move):
+                raise ValueError(f'Player {player.id} made an invalid move')
+
+    return record
+
+
+def _highlight(pixels: numpy.ndarray, block: Block) -> None:
+    """Draw an outline around <block> onto <pixels>, the RGB pixels, row by
+    row, of the board that contains it.
+    """
+    x, y = block.position
+    width = min(HIGHLIGHT_WIDTH, block.size)
+    end_x = x + block.size
+    end_y = y + block.size
+
+    pixels[y:y + width, x:end_x] = HIGHLIGHT_COLOUR
+    pixels[end_y - width:end_y, x:end_x] = HIGHLIGHT_COLOUR
+    pixels[y:end_y, x:x + width] = HIGHLIGHT_COLOUR
+    pixels[y:end_y, end_x - width:end_x] = HIGHLIGHT_COLOUR
+
+
+def replay_frames(record: GameRecord) -> Iterator[numpy.ndarray]:
+    """Yield the RGB frames of the game in <record>, each indexed by row and
+    then column, as image files store them.
+
+    There is one frame per move, showing the board before the move with the
+    block that the move acts on outlined, and a last frame with the final
+    board.
+    """
+    data = record.new_game()
+
+    for i in range(len(record.moves)):
+        move = decode(data.board, record.moves[i][1])
+
+        pixels = board_pixels(data.board, by_row=True)
+        _highlight(pixels, move[2])
+        yield pixels
+
+        record.do_move(data, i, move)
+
+    yield board_pixels(data.board, by_row=True)
+
+
+def encode_png(pixels: numpy.ndarray) -> bytes:
+    """Return <pixels>, an array of RGB pixels indexed by row and then column,
+    encoded as a PNG image.
+    """
+    height, width = pixels.shape[0], pixels.shape[1]
+    flat = pixels.reshape(height, width * 3)
+
+    # PNG stores rows, each starting with a filter type. Every row uses the
+    # Up filter (2), storing its difference from the row above, so the many
+    # repeated rows of a board become zeros and compress to almost nothing.
+    rows = numpy.empty((height, width * 3 + 1), dtype=numpy.uint8)
+    rows[:, 0] = 2
+    rows[0, 1:] = flat[0]
+    rows[1:, 1:] = flat[1:] - flat[:-1]
+
+    def chunk(kind: bytes, content: bytes) -> bytes:
+        return struct.pack('>I', len(content)) + kind + content + \
+            struct.pack('>I', zlib.crc32(kind + content))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + \
+        chunk(b'IDAT', zlib.compress(rows.tobytes(), 1)) + \
+        chunk(b'IEND', b'')
+
+
+def _write_png(pixels: numpy.ndarray, path: str) -> None:
+    """Encode <pixels>, indexed by row and then column, as a PNG image and
+    write it to <path>.
+    """
+    with open(path, 'wb') as file:
+        file.write(encode_png(pixels))
+
+
+def export_png(record: GameRecord, directory: str,
+               workers: Optional[int] = None) -> int:
+    """Write every frame of the game in <record> to <directory> as
+    frame_00000.png, frame_00001.png and so on, and return the number of
+    frames written.
+
+    Frames are encoded by <workers> processes, or one per CPU if <workers> is
+    None, while the next frames are rasterised. At most two frames per worker
+    are waiting at any time, so memory use doesn't grow with the game.
+    """
+    os.makedirs(directory, exist_ok=True)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    count = 0
+    pending: Deque[Future] = deque()
+
+    with ProcessPoolExecutor(workers) as executor:
+        for pixels in replay_frames(record):
+            path = os.path.join(directory, f'frame_{count:05d}.png')
+            pending.append(executor.submit(_write_png, pixels, path))
+            count += 1
+
+            if len(pending) >= 2 * workers:
+                pending.popleft().result()
+
+        while len(pending) > 0:
+            pending.popleft().result()
+
+    return count
+
+
+def export_raw(record: GameRecord, stream: BinaryIO) -> int:
+    """Write every frame of the game in <record> to <stream> as raw 8-bit RGB
+    pixels, row by row, and return the number of frames written.
+
+    Each frame is record.size by record.size pixels.
+    """
+    count = 0
+    for pixels in replay_frames(record):
+        stream.write(pixels.tobytes())
+        count += 1
+
+    return count
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-io': ['_write_png'],
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__', 'os',
+            'struct', 'zlib', 'collections', 'concurrent.futures', 'numpy',
+            'block', 'blocky', 'goal', 'moves', 'player', 'raster'
+        ]
+    })
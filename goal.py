@@ -24,28 +24,39 @@ This file contains the hierarchy of Goal classes.
 from __future__ import annotations
 import math
 import random
-from typing import List, Tuple
-from block import Block
+from typing import Dict, List, Optional, Tuple
+from actions import ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
+    SWAP_HORIZONTAL, SWAP_VERTICAL, PASS, PAINT
+from block import Block, palette_index
 from settings import colour_name, COLOUR_LIST
 
+# Boards with at least this many unit cells across have their blobs found by
+# blobs.largest_blobs, which labels runs of cells rather than single cells.
+TILED_BLOB_MIN_CELLS = 2048
 
-def generate_goals(num_goals: int) -> List[Goal]:
+
+def generate_goals(num_goals: int,
+                   rng: Optional[random.Random] = None) -> List[Goal]:
     """Return a randomly generated list of goals with length num_goals.
 
     All elements of the list must be the same type of goal, but each goal
     must have a different randomly generated colour from COLOUR_LIST. No two
-    goals can have the same colour.
+    goals can have the same colour. The goals are drawn from <rng>, or the
+    random module if <rng> is None.
 
     Precondition:
         - num_goals <= len(COLOUR_LIST)
     """
     # TODO: Recheck
 
+    if rng is None:
+        rng = random
+
     # Randomly select an x to select which goal to use
-    x = random.randint(1, 2)
+    x = rng.randint(1, 2)
     result = []
     colours = COLOUR_LIST.copy()
-    random.shuffle(colours)
+    rng.shuffle(colours)
 
     if x == 1:
         for _ in range(num_goals):
@@ -62,6 +73,169 @@ def generate_goals(num_goals: int) -> List[Goal]:
     return result
 
 
+def score_goals(goals: List[Goal], board: Block) -> List[int]:
+    """Return the score of each goal in <goals> on <board>, in the same order.
+
+    <board> is flattened once, into palette indices. All PerimeterGoals are
+    then scored by a single walk around the edge of the board, and all
+    BlobGoals by a single pass that finds the largest blob of every colour,
+    however many goals there are. On boards at least TILED_BLOB_MIN_CELLS
+    cells across, that pass is done by blobs.largest_blobs, which is only
+    split between worker processes if blobs.BLOB_WORKERS is above 1. Any
+    other kind of goal is scored from the board flattened into colours by
+    _flatten.
+    """
+    indices = _flatten_indices(board)
+    flattened = None
+    perimeter_counts = None
+    largest_blobs = None
+    result = []
+
+    for goal in goals:
+        if isinstance(goal, PerimeterGoal):
+            if perimeter_counts is None:
+                perimeter_counts = _perimeter_counts(indices)
+            result.append(perimeter_counts.get(palette_index(goal.colour), 0))
+
+        elif isinstance(goal, BlobGoal):
+            if largest_blobs is None and \
+                    len(indices) >= TILED_BLOB_MIN_CELLS:
+                from blobs import largest_blobs as tiled_largest_blobs
+                largest_blobs = tiled_largest_blobs(indices)
+            elif largest_blobs is None:
+                largest_blobs = _largest_blobs(indices)
+            result.append(largest_blobs.get(palette_index(goal.colour), 0))
+
+        else:
+            if flattened is None:
+                flattened = _flatten(board)
+            result.append(goal.score_flattened(flattened))
+
+    return result
+
+
+def _perimeter_counts(flattened: List[bytearray]) -> Dict[int, int]:
+    """Return the PerimeterGoal score of every colour on the board that was
+    flattened into <flattened> by _flatten_indices, by palette index.
+
+    As in PerimeterGoal, corner cells count twice.
+    """
+    n = len(flattened)
+    counts = {}
+
+    for i in range(n):
+        for colour in (flattened[i][0], flattened[i][n - 1],
+                       flattened[0][i], flattened[n - 1][i]):
+            counts[colour] = counts.get(colour, 0) + 1
+
+    return counts
+
+
+def _largest_blobs(flattened: List[bytearray]) -> Dict[int, int]:
+    """Return the size of the largest blob of every colour on the board that
+    was flattened into <flattened> by _flatten_indices, by palette index.
+
+    Every cell is labelled exactly once, whatever its colour.
+    """
+    n = len(flattened)
+    labelled = []
+    for _ in range(n):
+        labelled.append([False] * n)
+
+    largest = {}
+
+    for x in range(n):
+        for y in range(n):
+            if labelled[x][y]:
+                continue
+
+            # Label the whole blob that (x, y) belongs to
+            colour = flattened[x][y]
+            labelled[x][y] = True
+            to_visit = [(x, y)]
+            size = 0
+
+            while len(to_visit) > 0:
+                i, j = to_visit.pop()
+                size += 1
+
+                for a, b in ((i, j - 1), (i, j + 1), (i - 1, j), (i + 1, j)):
+                    if 0 <= a < n and 0 <= b < n and not labelled[a][b] and \
+                            flattened[a][b] == colour:
+                        labelled[a][b] = True
+                        to_visit.append((a, b))
+
+            if size > largest.get(colour, 0):
+                largest[colour] = size
+
+    return largest
+
+
+# The actions that only move a Block's unit cells around inside it, so that
+# it keeps the same number of cells of every colour.
+_REARRANGEMENTS = [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE,
+                   SWAP_HORIZONTAL, SWAP_VERTICAL]
+
+# The indices of the children along each side of a Block, for the sides
+# numbered 0 to 3: left, top, right and bottom.
+_SIDE_CHILDREN = [(1, 2), (0, 1), (0, 3), (2, 3)]
+
+
+def _side_count(block: Block, side: int, colour: Tuple[int, int, int]) -> int:
+    """Return the number of unit cells of <colour> along <side> of <block>.
+
+    Only the Blocks along that side are visited.
+    """
+    if len(block.children) == 0:
+        if block.colour_index == palette_index(colour):
+            return 2 ** (block.max_depth - block.level)
+        return 0
+
+    return sum(_side_count(block.children[i], side, colour)
+               for i in _SIDE_CHILDREN[side])
+
+
+def _sides_touched(board: Block, block: Block) -> List[int]:
+    """Return the sides of <board> that <block> lies along.
+
+    The sides are worked out from the indices of the children that lead from
+    <board> to <block>, not from pixel positions, which rounding makes
+    unreliable on deep boards.
+
+    Precondition: <block> is <board> or one of its descendants.
+
+    >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 10)
+    >>> block = board
+    >>> for index in [0, 0, 0, 1, 1, 1, 0, 0, 0, 3]:
+    ...     _ = block.smash()
+    ...     block = block.children[index]
+    >>> block.level
+    10
+    >>> _sides_touched(board, block)
+    []
+    >>> _sides_touched(board, board.children[0].children[0])
+    [1, 2]
+    """
+    sides = [0, 1, 2, 3]
+    for index in block.path_from(board):
+        sides = [side for side in sides if index in _SIDE_CHILDREN[side]]
+
+    return sides
+
+
+def _flatten_indices(block: Block) -> List[bytearray]:
+    """Return <block> as columns of unit cells, in the same layout as
+    _flatten, but with each unit cell given by the index of its colour in
+    block.PALETTE.
+
+    <block> may also be a sharedboard.BlockView, whose columns are read
+    straight from shared memory.
+
+    Precondition: every colour on <block> has an index below 256.
+    """
+    return block.colour_columns()
+
+
 def _flatten(block: Block) -> List[List[Tuple[int, int, int]]]:
     """Return a two-dimensional list representing <block> as rows and columns of
     unit cells.
@@ -80,50 +254,13 @@ def _flatten(block: Block) -> List[List[Tuple[int, int, int]]]:
 
     num_cells = 2 ** (block.max_depth - block.level)
 
-    result = []
-
-    if len(block.children) == 0:
-
-        for i in range(num_cells):
-            row = []
-            for j in range(num_cells):
-                row.append(block.colour)
-            result.append(row)
-
-    else:
-        upper_right = _flatten(block.children[0])
-        upper_left = _flatten(block.children[1])
-        lower_left = _flatten(block.children[2])
-        lower_right = _flatten(block.children[3])
-
-        # Making result the board that will be appended with the correct values
-        for i in range(num_cells):
-            row = []
-            for j in range(num_cells):
-                row.append(None)
-            result.append(row)
-
-        quadrant_size = num_cells // 2
-
-        for i in range(num_cells):
-            for j in range(num_cells):
+    # Making result the board that will be filled in with the correct values
+    result = [[None] * num_cells for _ in range(num_cells)]
 
-                if (i < quadrant_size) and (j < quadrant_size):
-                    # Considering top left quadrant now
-                    result[i][j] = upper_left[i][j]
-
-                elif i < quadrant_size <= j:
-                    # Considering the lower left quadrant now
-                    result[i][j] = lower_left[i][j - quadrant_size]
-
-                elif i >= quadrant_size > j:
-                    # Considering the upper right quadrant now
-                    result[i][j] = upper_right[i - quadrant_size][j]
-
-                elif (i >= quadrant_size) and (j >= quadrant_size):
-                    # Considering the lower right quadrant now
-                    result[i][j] = \
-                        lower_right[i - quadrant_size][j - quadrant_size]
+    for leaf, x, y, cells in block.leaf_cells():
+        run = [leaf.colour] * cells
+        for i in range(x, x + cells):
+            result[i][y:y + cells] = run
 
     return result
 
@@ -150,6 +287,31 @@ class Goal:
 
         The score is always greater than or equal to 0.
         """
+        return score_goals([self], board)[0]
+
+    def score_flattened(self, flattened: List[List[Tuple[int, int, int]]]) \
+            -> int:
+        """Return the score for this goal on the board that was flattened into
+        <flattened> by _flatten.
+
+        The score is always greater than or equal to 0.
+        """
+        raise NotImplementedError
+
+    def upper_bound(self, board: Block, block: Block,
+                    action: Optional[Tuple[str, Optional[int]]] = None,
+                    score: Optional[int] = None) -> int:
+        """Return a score that this goal can't go above on <board> once
+        <action> has been done to <block>, or once any one action has been
+        done to <block> if <action> is None.
+
+        <score> is the current score for this goal on <board>, if it is
+        already known. The bound is worked out from colour counts and the
+        Blocks along the edges of <block>, without copying or scoring <board>,
+        so moves that can't beat a score can be skipped cheaply.
+
+        Precondition: <block> is <board> or one of its descendants.
+        """
         raise NotImplementedError
 
     def description(self) -> str:
@@ -163,14 +325,15 @@ class PerimeterGoal(Goal):
      the perimeter with target colour
      """
 
-    def score(self, board: Block) -> int:
+    def score_flattened(self, flattened: List[List[Tuple[int, int, int]]]) \
+            -> int:
         """Scores the grid based on the rules of a perimeter goal"""
 
         # TODO: Recheck
         # We need to score according to the the number of unit cells
-        # on the outer edges of the Block object <board>
+        # on the outer edges of the flattened board
         total_score = 0
-        flat_version = _flatten(board)
+        flat_version = flattened
         # We will compare the flattened version
         # with the desired colour of the block.
 
@@ -197,6 +360,29 @@ class PerimeterGoal(Goal):
 
         return total_score
 
+    def upper_bound(self, board: Block, block: Block,
+                    action: Optional[Tuple[str, Optional[int]]] = None,
+                    score: Optional[int] = None) -> int:
+        """The cells outside of <block> keep their colours, so the bound is
+        the score they make now plus the most that the cells of <block> on
+        the perimeter could make.
+        """
+        if score is None:
+            score = sum(_side_count(board, side, self.colour)
+                        for side in range(4))
+        if action == PASS:
+            return score
+
+        sides = _sides_touched(board, block)
+        inside = sum(_side_count(block, side, self.colour) for side in sides)
+        capacity = len(sides) * 2 ** (block.max_depth - block.level)
+
+        if action in _REARRANGEMENTS:
+            # Each cell of the target colour is on at most two sides
+            capacity = min(capacity, 2 * block.colour_count(self.colour))
+
+        return score - inside + capacity
+
     def description(self) -> str:
         # TODO: Make shorter
         colour = colour_name(self.colour)
@@ -212,12 +398,12 @@ class BlobGoal(Goal):
     target colour.
     """
 
-    def score(self, board: Block) -> int:
+    def score_flattened(self, flattened: List[List[Tuple[int, int, int]]]) \
+            -> int:
         """Returns the score for the blob goal"""
         # TODO: Recheck
 
-        # First flatten the board to make life easier
-        flattened_board = _flatten(board)
+        flattened_board = flattened
         n = len(flattened_board)
 
         visited = []
@@ -304,6 +490,25 @@ class BlobGoal(Goal):
 
             return total
 
+    def upper_bound(self, board: Block, block: Block,
+                    action: Optional[Tuple[str, Optional[int]]] = None,
+                    score: Optional[int] = None) -> int:
+        """No blob can be bigger than the number of cells of the target colour
+        that there will be on <board>.
+        """
+        if action == PASS and score is not None:
+            return score
+
+        total = board.colour_count(self.colour)
+
+        if action == PASS or action in _REARRANGEMENTS:
+            return total
+        elif action == PAINT:
+            return total + 1
+        else:
+            return total - block.colour_count(self.colour) + \
+                4 ** (block.max_depth - block.level)
+
     def description(self) -> str:
         # TODO: Make shorter
         colour = colour_name(self.colour)
@@ -319,8 +524,8 @@ if __name__ == '__main__':
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'doctest', 'python_ta', 'random', 'typing', 'block', 'settings',
-            'math', '__future__'
+            'doctest', 'python_ta', 'random', 'typing', 'actions', 'block',
+            'settings', 'math', '__future__', 'blobs'
         ],
         'max-attributes': 15
     })
@@ -0,0 +1,321 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains an interned, immutable representation of Blocky boards.
+
+An InternedBlock records only the colours and structure of a Block relative
+to its own upper-left corner. Structurally identical subtrees are the same
+InternedBlock object, wherever they appear and in however many boards, so a
+search that holds thousands of successor boards only stores each distinct
+subtree once. Moves never change an InternedBlock: apply_move returns a new
+board that shares every subtree the move didn't touch with the old one.
+
+The intern tables only hold weak references, so subtrees that no board uses
+any more are dropped from them as soon as they are garbage collected.
+"""
+from __future__ import annotations
+import math
+import random
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+from actions import ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
+    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE
+from block import Block
+from settings import COLOUR_LIST
+
+
+class InternedBlock:
+    """An immutable square of a Blocky board that is shared by every board
+    containing the same colours in the same layout.
+
+    Do not create InternedBlocks directly; use leaf, parent and intern_block
+    so that identical subtrees are always the same object.
+
+    === Public Attributes ===
+    depth:
+        The number of levels this block may still be subdivided by, i.e. its
+        max_depth minus its level.
+    colour:
+        The colour of this block if it is not subdivided, otherwise None.
+    children:
+        The four blocks into which this block is subdivided, in the same order
+        as Block.children, or an empty tuple if it is not subdivided.
+
+    === Representation Invariants ===
+    - len(children) == 0 or len(children) == 4
+    - Each child's depth is one less than this block's depth.
+    - colour is None iff this block has children.
+    """
+    __slots__ = ['depth', 'colour', 'children', '__weakref__']
+    depth: int
+    colour: Optional[Tuple[int, int, int]]
+    children: Tuple[InternedBlock, ...]
+
+    def __init__(self, depth: int, colour: Optional[Tuple[int, int, int]],
+                 children: Tuple[InternedBlock, ...]) -> None:
+        """Initialize this block. Only called by leaf and parent.
+        """
+        self.depth = depth
+        self.colour = colour
+        self.children = children
+
+
+# The intern tables. A parent is keyed by the ids of its children, which stay
+# valid for as long as the parent, and so its entry, is alive.
+_LEAVES = weakref.WeakValueDictionary()
+_PARENTS = weakref.WeakValueDictionary()
+
+
+def leaf(colour: Tuple[int, int, int], depth: int) -> InternedBlock:
+    """Return the interned undivided block of <colour> at <depth>.
+    """
+    key = (depth, colour)
+    node = _LEAVES.get(key)
+
+    if node is None:
+        node = InternedBlock(depth, colour, ())
+        _LEAVES[key] = node
+
+    return node
+
+
+def parent(children: Tuple[InternedBlock, ...]) -> InternedBlock:
+    """Return the interned block that is subdivided into <children>.
+
+    Precondition: len(children) == 4 and all the children have the same depth.
+    """
+    key = tuple(id(child) for child in children)
+    node = _PARENTS.get(key)
+
+    if node is None:
+        node = InternedBlock(children[0].depth + 1, None, tuple(children))
+        _PARENTS[key] = node
+
+    return node
+
+
+def interned_count() -> int:
+    """Return the number of distinct subtrees currently interned.
+    """
+    return len(_LEAVES) + len(_PARENTS)
+
+
+def intern_block(block: Block) -> InternedBlock:
+    """Return the interned version of <block>.
+    """
+    if len(block.children) == 0:
+        return leaf(block.colour, block.max_depth - block.level)
+
+    return parent(tuple(intern_block(child) for child in block.children))
+
+
+def materialize(node: InternedBlock, position: Tuple[int, int], size: int,
+                max_depth: int) -> Block:
+    """Return a new Block with the layout of <node>, its upper-left corner at
+    <position> and dimensions <size> by <size>, in a board of <max_depth>.
+    """
+    block = Block(position, size, node.colour, max_depth - node.depth,
+                  max_depth)
+
+    if len(node.children) > 0:
+        # set_children moves the children into place
+        block.set_children([materialize(child, position, round(size / 2.0),
+                                        max_depth)
+                            for child in node.children])
+
+    return block
+
+
+def _rotate(node: InternedBlock, direction: int,
+            rotated: Dict[int, InternedBlock]) -> InternedBlock:
+    """Return <node> rotated clockwise if <direction> is 1, and
+    counter-clockwise if it is 3.
+
+    <rotated> maps the ids of blocks that have already been rotated in this
+    move to their rotations, so shared subtrees are only rotated once.
+    """
+    if len(node.children) == 0:
+        return node
+
+    if id(node) not in rotated:
+        c = [_rotate(child, direction, rotated) for child in node.children]
+        if direction == 1:
+            rotated[id(node)] = parent((c[1], c[2], c[3], c[0]))
+        else:
+            rotated[id(node)] = parent((c[3], c[0], c[1], c[2]))
+
+    return rotated[id(node)]
+
+
+def _smash(depth: int, level: int, rng: random.Random) -> InternedBlock:
+    """Return a block subdivided into four children drawn from <rng>, at
+    <depth> and <level>, in the same way as Block.smash.
+
+    Random numbers are drawn in the same order as Block.smash draws them, so
+    both give the same result from generators in the same state.
+
+    Precondition: depth > 0
+    """
+    children = []
+    for _ in range(4):
+        children.append(leaf(rng.choice(COLOUR_LIST), depth - 1))
+
+    for i in range(4):
+        if rng.random() < math.exp(-0.25 * (level + 1)) and depth > 1:
+            children[i] = _smash(depth - 1, level + 1, rng)
+
+    return parent(tuple(children))
+
+
+def _majority_colour(node: InternedBlock) -> Optional[Tuple[int, int, int]]:
+    """Return the colour of strictly more of <node>'s children than any other
+    colour, or None if there is a tie for the most.
+    """
+    colours = []
+    counts = []
+    for child in node.children:
+        if child.colour in colours:
+            counts[colours.index(child.colour)] += 1
+        else:
+            colours.append(child.colour)
+            counts.append(1)
+
+    most = max(counts)
+    if counts.count(most) > 1:
+        return None
+    return colours[counts.index(most)]
+
+
+def _apply_at(node: InternedBlock, level: int,
+              action: Tuple[str, Optional[int]],
+              colour: Optional[Tuple[int, int, int]],
+              rng: random.Random) -> Optional[InternedBlock]:
+    """Return the result of doing <action> to <node>, which is at <level>, or
+    None if the action can't be done. <colour> is the colour to paint with,
+    and a smash draws from <rng>.
+    """
+    if action in [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE]:
+        if len(node.children) == 0:
+            return None
+        return _rotate(node, action[1], {})
+
+    elif action == SWAP_HORIZONTAL:
+        if len(node.children) == 0:
+            return None
+        c = node.children
+        return parent((c[1], c[0], c[3], c[2]))
+
+    elif action == SWAP_VERTICAL:
+        if len(node.children) == 0:
+            return None
+        c = node.children
+        return parent((c[3], c[2], c[1], c[0]))
+
+    elif action == SMASH:
+        if len(node.children) != 0 or node.depth == 0:
+            return None
+        return _smash(node.depth, level, rng)
+
+    elif action == PAINT:
+        if len(node.children) != 0 or node.depth != 0 or node.colour == colour:
+            return None
+        return leaf(colour, 0)
+
+    elif action == COMBINE:
+        if len(node.children) == 0 or node.depth != 1:
+            return None
+        majority = _majority_colour(node)
+        if majority is None:
+            return None
+        return leaf(majority, 1)
+
+    elif action == PASS:
+        return node
+
+    return None
+
+
+def apply_move(root: InternedBlock, path: List[int],
+               action: Tuple[str, Optional[int]],
+               colour: Optional[Tuple[int, int, int]] = None,
+               rng: Optional[random.Random] = None) \
+        -> Optional[InternedBlock]:
+    """Return the board that results from doing <action> to the block reached
+    from <root> by following the child indices in <path>, or None if the
+    action can't be done there. <colour> is the colour to paint with, and a
+    smash draws from <rng>, or the random module if <rng> is None.
+
+    <root> is left unchanged, and the new board shares every subtree that the
+    action didn't touch with it. Only the blocks along <path> are new.
+    """
+    ancestors = []
+    node = root
+    for index in path:
+        if len(node.children) == 0:
+            return None
+        ancestors.append(node)
+        node = node.children[index]
+
+    if rng is None:
+        rng = random
+
+    result = _apply_at(node, len(path), action, colour, rng)
+    if result is None:
+        return None
+
+    for i in range(len(path) - 1, -1, -1):
+        children = list(ancestors[i].children)
+        children[path[i]] = result
+        result = parent(tuple(children))
+
+    return result
+
+
+def flatten(node: InternedBlock) -> List[List[Tuple[int, int, int]]]:
+    """Return <node> as columns of unit cells, in the same form as
+    goal._flatten, so that it can be scored with Goal.score_flattened.
+    """
+    n = 2 ** node.depth
+    if len(node.children) == 0:
+        return [[node.colour] * n for _ in range(n)]
+
+    upper_right, upper_left, lower_left, lower_right = \
+        [flatten(child) for child in node.children]
+    result = []
+    for i in range(n // 2):
+        result.append(upper_left[i] + lower_left[i])
+    for i in range(n // 2):
+        result.append(upper_right[i] + lower_right[i])
+
+    return result
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
+            'weakref', 'actions', 'block', 'settings'
+        ],
+        'max-attributes': 15
+    })
@@ -0,0 +1,132 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains a compact encoding of moves that doesn't depend on any one
+board object.
+
+A move made by a player is a tuple of an action, a direction and the Block to
+act on, which only means something for the board that Block belongs to. Here
+the Block is given instead by its path: the indices of the children to follow
+from the root to reach it. A path means the same thing on every copy of a
+board, in any process, and an action and a path together pack into a single
+int, so a move can be worked out on one copy of a board and done on another.
+
+The int holds the index of the action in ACTIONS in its lowest 3 bits, then
+the path itself, 2 bits per child index, starting with the index nearest the
+root, and then a single 1 bit that marks where the path ends. Python ints have
+no fixed size, so a path can be as long as a board is deep.
+"""
+from __future__ import annotations
+from typing import List, Optional, Tuple
+
+from actions import ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
+    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE
+from block import Block
+
+# Every action, in the order of the numbers that stand for them in an encoded
+# move.
+ACTIONS = [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, SWAP_HORIZONTAL,
+           SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE]
+
+# The number of bits used for the action.
+_ACTION_BITS = 3
+
+
+def block_path(board: Block, block: Block) -> List[int]:
+    """Return the indices of the children to follow from <board> to reach
+    <block>.
+
+    Precondition: <block> is <board> or one of its descendants.
+    """
+    return block.path_from(board)
+
+
+def resolve(board: Block, path: List[int]) -> Optional[Block]:
+    """Return the Block reached from <board> by following the child indices in
+    <path>, or None if there is no such Block.
+    """
+    block = board
+    for index in path:
+        if len(block.children) == 0:
+            return None
+        block = block.children[index]
+
+    return block
+
+
+def pack(action: Tuple[str, Optional[int]], path: List[int]) -> int:
+    """Return <action> to be done to the Block at the end of <path> as a single
+    int.
+
+    >>> unpack(pack(SMASH, [3, 0, 2]))
+    (('smash', None), [3, 0, 2])
+    >>> unpack(pack(SMASH, [1] * 20)) == (SMASH, [1] * 20)
+    True
+    """
+    # The bit above the path marks its end.
+    code = 1
+    for index in reversed(path):
+        code = (code << 2) | index
+
+    return (code << _ACTION_BITS) | ACTIONS.index(action)
+
+
+def unpack(code: int) -> Tuple[Tuple[str, Optional[int]], List[int]]:
+    """Return the action and the path that were packed into <code> by pack.
+    """
+    action = ACTIONS[code & ((1 << _ACTION_BITS) - 1)]
+    code >>= _ACTION_BITS
+
+    path = []
+    while code > 1:
+        path.append(code & 3)
+        code >>= 2
+
+    return action, path
+
+
+def encode(board: Block, move: Tuple[str, Optional[int], Block]) -> int:
+    """Return <move>, which acts on a Block of <board>, as a single int.
+    """
+    return pack((move[0], move[1]), block_path(board, move[2]))
+
+
+def decode(board: Block, code: int) \
+        -> Optional[Tuple[str, Optional[int], Block]]:
+    """Return the move that <code> stands for as a move on <board>, or None if
+    <board> has no Block at its path.
+    """
+    action, path = unpack(code)
+    block = resolve(board, path)
+
+    if block is None:
+        return None
+    return action[0], action[1], block
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', '__future__', 'actions', 'block'
+        ]
+    })
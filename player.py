@@ -22,19 +22,24 @@ Misha Schwartz, and Jaisie Sin.
 This file contains the hierarchy of player classes.
 """
 from __future__ import annotations
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, TYPE_CHECKING
 import random
-import pygame
 
 from block import Block
 from goal import Goal, generate_goals
+from streams import GameStreams
 
 from actions import KEY_ACTION, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
     SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE
 
+# pygame is only imported by the methods that handle the mouse and keyboard,
+# so that computer players can be used without loading it.
+if TYPE_CHECKING:
+    import pygame
 
-def create_players(num_human: int, num_random: int, smart_players: List[int]) \
-        -> List[Player]:
+
+def create_players(num_human: int, num_random: int, smart_players: List[int],
+                   streams: Optional[GameStreams] = None) -> List[Player]:
     """Return a new list of Player objects.
 
     <num_human> is the number of human player, <num_random> is the number of
@@ -45,11 +50,16 @@ def create_players(num_human: int, num_random: int, smart_players: List[int]) \
     <num_random> RandomPlayer objects, then the same number of SmartPlayer
     objects as the length of <smart_players>. The difficulty levels in
     <smart_players> should be applied to each SmartPlayer object, in order.
+
+    If <streams> is given, the goals are drawn from streams.goals, and each
+    computer player makes its moves with its own generator from <streams>.
+    Otherwise everything is drawn from the random module.
     """
     # TODO: Recheck
     total_num = num_human + num_random + len(smart_players)
     result = []
-    goals = generate_goals(total_num)
+    goals = generate_goals(total_num,
+                           None if streams is None else streams.goals)
 
     for i in range(num_human):
         goal = goals[i]
@@ -59,7 +69,8 @@ def create_players(num_human: int, num_random: int, smart_players: List[int]) \
 
     for i in range(num_human, num_human + num_random):
         goal = goals[i]
-        player = RandomPlayer(i, goal)
+        player = RandomPlayer(i, goal,
+                              None if streams is None else streams.player(i))
 
         result.append(player)
 
@@ -68,7 +79,8 @@ def create_players(num_human: int, num_random: int, smart_players: List[int]) \
         goal = goals[x]
         difficulty = smart_players[i]
 
-        player = SmartPlayer(x, goal, difficulty)
+        player = SmartPlayer(x, goal, difficulty,
+                             None if streams is None else streams.player(x))
         result.append(player)
 
     return result
@@ -101,33 +113,26 @@ def _get_block(block: Block, location: Tuple[int, int], level: int) -> \
     size = block.size
 
     # position_x and position_y is left_most and top_most of the range
-    if position_x <= location_x < (position_x + size) and \
-            position_y <= location_y < (position_y + size):
-
-        if len(block.children) == 0:
-            # Represents the case where it is a leaf before desired level
-            # or max_depth is reached (this is deepest block)
-            return block
-
-        elif block.level == level:
-            # Desired depth is reached
-            return block
-
-        # Now we need to recursively call on a child block. This means we have
-        # to figure out which quadrant contains location and only search for the
-        # corresponding child block.
-        # We can do so by using a for loop over children with an if condition
-        else:
-            for child in block.children:
-                child_x = child.position[0]
-                child_y = child.position[1]
+    if not (position_x <= location_x < (position_x + size) and
+            position_y <= location_y < (position_y + size)):
+        return None
 
-                if child_x <= location_x < (child_x + child.size) and \
-                        child_y <= location_y < (child_y + child.size):
-                    return _get_block(child, location, level)
+    # Stop at a leaf, which is the deepest block, or once the desired depth
+    # is reached. Otherwise only the child whose quadrant contains location
+    # needs to be searched.
+    while len(block.children) != 0 and block.level != level:
+        for child in block.children:
+            child_x = child.position[0]
+            child_y = child.position[1]
+
+            if child_x <= location_x < (child_x + child.size) and \
+                    child_y <= location_y < (child_y + child.size):
+                block = child
+                break
+        else:
+            return None
 
-    else:
-        return None
+    return block
 
 
 class Player:
@@ -181,6 +186,73 @@ def _create_move(action: Tuple[str, Optional[int]], block: Block) -> \
     return action[0], action[1], block
 
 
+def _do_action(block: Block, action: Tuple[str, Optional[int]],
+               colour: Tuple[int, int, int],
+               rng: Optional[random.Random] = None) -> bool:
+    """Attempt to do <action> to <block>, painting with <colour> and smashing
+    with <rng>, or the random module if <rng> is None.
+
+    Return True iff the action was done.
+    """
+    if action in [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE]:
+        return block.rotate(action[1])
+    elif action in [SWAP_HORIZONTAL, SWAP_VERTICAL]:
+        return block.swap(action[1])
+    elif action == SMASH:
+        return block.smash(rng)
+    elif action == PAINT:
+        return block.paint(colour)
+    elif action == COMBINE:
+        return block.combine()
+    return action == PASS
+
+
+def _block_actions(block: Block, colour: Tuple[int, int, int]) \
+        -> List[Tuple[str, Optional[int]]]:
+    """Return the actions other than PASS that can be done to <block> itself
+    by a player who paints with <colour>, in the order that Block.move_count
+    counts them.
+    """
+    if len(block.children) > 0:
+        actions = [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, SWAP_HORIZONTAL,
+                   SWAP_VERTICAL]
+        if block.combinable():
+            actions.append(COMBINE)
+        return actions
+    elif block.smashable():
+        return [SMASH]
+    elif block.colour != colour:
+        return [PAINT]
+    return []
+
+
+def _sample_move(board: Block, colour: Tuple[int, int, int], index: int) \
+        -> Tuple[str, Optional[int], Block]:
+    """Return the move numbered <index> out of the board.move_count(<colour>)
+    moves that can be done to <board> and its descendants.
+
+    Moves are numbered with the actions on a Block first, followed by the
+    moves within each of its children in turn, so only the Blocks between
+    <board> and the Block of the move are visited.
+
+    Precondition: 0 <= index < board.move_count(colour)
+    """
+    block = board
+
+    while True:
+        actions = _block_actions(block, colour)
+        if index < len(actions):
+            return _create_move(actions[index], block)
+
+        index -= len(actions)
+        for child in block.children:
+            count = child.move_count(colour)
+            if index < count:
+                block = child
+                break
+            index -= count
+
+
 class HumanPlayer(Player):
     """A human player.
     """
@@ -212,6 +284,8 @@ class HumanPlayer(Player):
 
         If no block is selected by the player, return None.
         """
+        import pygame
+
         mouse_pos = pygame.mouse.get_pos()
         block = _get_block(board, mouse_pos, self._level)
 
@@ -222,6 +296,8 @@ class HumanPlayer(Player):
         the mapping in KEY_ACTION, as well as the W and S keys for changing
         the level.
         """
+        import pygame
+
         if event.type == pygame.KEYDOWN:
             if event.key in KEY_ACTION:
                 self._desired_action = KEY_ACTION[event.key]
@@ -256,80 +332,58 @@ class RandomPlayer(Player):
     # _proceed:
     #   True when the player should make a move, False when the player should
     #   wait.
+    # _rng:
+    #   The generator that this player's moves are drawn from, or None to use
+    #   the random module.
     _proceed: bool
+    _rng: Optional[random.Random]
 
-    def __init__(self, player_id: int, goal: Goal) -> None:
+    def __init__(self, player_id: int, goal: Goal,
+                 rng: Optional[random.Random] = None) -> None:
         Player.__init__(self, player_id, goal)
         self._proceed = False
+        self._rng = rng
 
     def get_selected_block(self, board: Block) -> Optional[Block]:
         return None
 
     def process_event(self, event: pygame.event.Event) -> None:
+        import pygame
+
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             self._proceed = True
 
-    def _get_valid_moves(self, board: Block) -> \
-            List[Optional[Tuple[str, Optional[int], Block], int]]:
-        """Return a list of valid moves for the board with what score they have
+    def proceed(self) -> None:
+        """Let this player make its next move without waiting for a mouse
+        click, for games that are played without a window.
         """
-        valid_moves = []
+        self._proceed = True
 
-        if board.create_copy().rotate(ROTATE_CLOCKWISE[1]):
-            valid_moves.append(((ROTATE_CLOCKWISE[0],
-                                 ROTATE_CLOCKWISE[1], board),
-                                self.goal.score(board.create_copy())))
-
-        if board.create_copy().rotate(ROTATE_COUNTER_CLOCKWISE[1]):
-            valid_moves.append(((ROTATE_COUNTER_CLOCKWISE[0],
-                                 ROTATE_COUNTER_CLOCKWISE[1], board),
-                                self.goal.score(board.create_copy())))
-
-        if board.create_copy().swap(SWAP_HORIZONTAL[1]):
-            valid_moves.append(((SWAP_HORIZONTAL[0],
-                                 SWAP_HORIZONTAL[1], board),
-                                self.goal.score(board.create_copy())))
-
-        if board.create_copy().swap(SWAP_VERTICAL[1]):
-            valid_moves.append(((SWAP_VERTICAL[0],
-                                 SWAP_VERTICAL[1], board),
-                                self.goal.score(board.create_copy())))
-
-        if board.create_copy().smash():
-            valid_moves.append(((SMASH[0],
-                                 SMASH[1], board),
-                                self.goal.score(board.create_copy())))
-
-        if board.create_copy().paint(self.goal.colour):
-            valid_moves.append(((PAINT[0],
-                                 PAINT[1], board),
-                                self.goal.score(board.create_copy())))
-
-        if board.create_copy().combine():
-            valid_moves.append(((COMBINE[0],
-                                 COMBINE[1], board),
-                                self.goal.score(board.create_copy())))
-
-        return valid_moves
+    def ready_to_move(self) -> bool:
+        """Return True iff generate_move would make a move rather than wait.
+        """
+        return self._proceed
 
     def generate_move(self, board: Block) ->\
             Optional[Tuple[str, Optional[int], Block]]:
         """Return a valid, randomly generated move.
 
         A valid move is a move other than PASS that can be successfully
-        performed on the <board>.
+        performed on the <board>. Every valid move on <board> or any of its
+        descendants is equally likely, and one is found by following the move
+        counts from the root down to its Block, without copying <board>.
 
         This function does not mutate <board>.
         """
         if not self._proceed:
             return None  # Do not remove
 
-        valid_moves = self._get_valid_moves(board)
+        count = board.move_count(self.goal.colour)
+        rng = random if self._rng is None else self._rng
 
-        if len(valid_moves) > 0:
-            # tup contains (move, score)
-            tup = random.choice(valid_moves)
-            move = tup[0]
+        if count > 0:
+            move = _sample_move(board, self.goal.colour,
+                                rng.randrange(count))
 
         else:
             move = (PASS[0], PASS[1], board)
@@ -344,63 +398,62 @@ class SmartPlayer(Player):
     # _proceed:
     #   True when the player should make a move, False when the player should
     #   wait.
+    # _rng:
+    #   The generator that this player picks moves with, and that the smashes
+    #   it tries out draw from, or None to use the random module.
     _proceed: bool
     _difficulty: int
+    _rng: Optional[random.Random]
 
-    def __init__(self, player_id: int, goal: Goal, difficulty: int) -> None:
+    def __init__(self, player_id: int, goal: Goal, difficulty: int,
+                 rng: Optional[random.Random] = None) -> None:
         Player.__init__(self, player_id, goal)
         self._difficulty = difficulty
         self._proceed = False
+        self._rng = rng
 
     def get_selected_block(self, board: Block) -> Optional[Block]:
         return None
 
     def process_event(self, event: pygame.event.Event) -> None:
+        import pygame
+
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             self._proceed = True
 
-    def _get_valid_moves(self, board: Block) -> \
-            List[Optional[Tuple[str, Optional[int], Block], int]]:
-        """Return a list of valid moves for the board with what score they have
+    def proceed(self) -> None:
+        """Let this player make its next move without waiting for a mouse
+        click, for games that are played without a window.
         """
-        valid_moves = []
-
-        if board.create_copy().rotate(ROTATE_CLOCKWISE[1]):
-            valid_moves.append(((ROTATE_CLOCKWISE[0],
-                                 ROTATE_CLOCKWISE[1], board),
-                                self.goal.score(board.create_copy())))
-
-        if board.create_copy().rotate(ROTATE_COUNTER_CLOCKWISE[1]):
-            valid_moves.append(((ROTATE_COUNTER_CLOCKWISE[0],
-                                 ROTATE_COUNTER_CLOCKWISE[1], board),
-                                self.goal.score(board.create_copy())))
-
-        if board.create_copy().swap(SWAP_HORIZONTAL[1]):
-            valid_moves.append(((SWAP_HORIZONTAL[0],
-                                 SWAP_HORIZONTAL[1], board),
-                                self.goal.score(board.create_copy())))
+        self._proceed = True
 
-        if board.create_copy().swap(SWAP_VERTICAL[1]):
-            valid_moves.append(((SWAP_VERTICAL[0],
-                                 SWAP_VERTICAL[1], board),
-                                self.goal.score(board.create_copy())))
+    def ready_to_move(self) -> bool:
+        """Return True iff generate_move would make a move rather than wait.
+        """
+        return self._proceed
 
-        if board.create_copy().smash():
-            valid_moves.append(((SMASH[0],
-                                 SMASH[1], board),
-                                self.goal.score(board.create_copy())))
+    def _get_valid_moves(self, board: Block) -> \
+            List[Tuple[str, Optional[int], Block]]:
+        """Return a list of valid moves for the board
 
-        if board.create_copy().paint(self.goal.colour):
-            valid_moves.append(((PAINT[0],
-                                 PAINT[1], board),
-                                self.goal.score(board.create_copy())))
+        Which actions are valid is read off the board rather than found by
+        trying each one on a copy.
+        """
+        return [_create_move(action, board)
+                for action in _block_actions(board, self.goal.colour)]
 
-        if board.create_copy().combine():
-            valid_moves.append(((COMBINE[0],
-                                 COMBINE[1], board),
-                                self.goal.score(board.create_copy())))
+    def _score_move(self, board: Block,
+                    move: Tuple[str, Optional[int], Block]) -> int:
+        """Return the score for this player's goal on a copy of <board> once
+        <move> has been done to it.
+        """
+        copy = board.create_copy()
+        block = _get_block(copy, move[2].position, move[2].level)
+        _do_action(block, (move[0], move[1]), self.goal.colour, self._rng)
+        score = self.goal.score(copy)
+        copy.release()
 
-        return valid_moves
+        return score
 
     def generate_move(self, board: Block) ->\
             Optional[Tuple[str, Optional[int], Block]]:
@@ -422,18 +475,29 @@ class SmartPlayer(Player):
         valid_moves = self._get_valid_moves(board)
 
         if len(valid_moves) > 0:
-            random.shuffle(valid_moves)
+            rng = random if self._rng is None else self._rng
+            rng.shuffle(valid_moves)
+            # Only as many moves as the difficulty are considered, or every
+            # move if there are fewer.
             to_pick = []
-            for _ in range(self._difficulty):
+            for _ in range(min(self._difficulty, len(valid_moves))):
                 to_pick.append(valid_moves.pop())
 
-            best_score = self.goal.score(board)
+            current_score = self.goal.score(board)
+            best_score = current_score
             best_move = (PASS[0], PASS[1], board)
 
-            for move, score in valid_moves:
-                if score > best_score:
-                    best_score = score
-                    best_move = move
+            for move in to_pick:
+                # Only copy and score the board for moves that might beat
+                # the best so far
+                bound = self.goal.upper_bound(board, move[2],
+                                              (move[0], move[1]),
+                                              current_score)
+                if bound > best_score:
+                    score = self._score_move(board, move)
+                    if score > best_score:
+                        best_score = score
+                        best_move = move
 
             self._proceed = False  # Must set to False before returning!
             return best_move
@@ -450,7 +514,7 @@ if __name__ == '__main__':
         'allowed-io': ['process_event'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'actions', 'block',
-            'goal', 'pygame', '__future__'
+            'goal', 'pygame', 'streams', '__future__'
         ],
         'max-attributes': 10,
         'generated-members': 'pygame.*'
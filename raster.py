@@ -0,0 +1,210 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains a renderer that draws a whole board in one operation.
+
+Instead of one draw call per undivided block, the board is turned into a grid
+of colour indices with one entry per unit cell, the grid is scaled up to the
+size of the board in pixels with NumPy, and the resulting array is copied onto
+the screen in a single blit. That cost depends on the size of the board
+in pixels, not on how many blocks it has.
+
+Boards with more unit cells across than pixels are drawn with level of
+detail: the grid never has more cells across than the board has pixels, and a
+block that covers a single cell of it is drawn in its dominant colour without
+looking at its descendants.
+
+Only draw_board needs pygame, which it imports when it is first called, so the
+pixel arrays can also be made without a window.
+
+The picture only matches drawing one square at a time exactly when the board
+is a multiple of 2 ** max_depth pixels wide. Otherwise the rounding in
+Block._child_size makes neighbouring squares overlap by a pixel, or leave one
+out. Each pixel they share is given here to the later cell, and one square at
+a time it goes to whichever square is drawn last, so the two differ along
+some block edges: on a 750 pixel board, by a few hundred pixels at depth 5
+and about a thousand at depth 7.
+
+The game's own screens still draw with renderer.Renderer, square by square,
+since that class keeps its surface to itself. draw_board is for anything that
+has a pygame.Surface of its own, and export uses board_pixels.
+"""
+from __future__ import annotations
+from functools import lru_cache
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import numpy
+
+from block import Block, PALETTE, palette_index
+
+if TYPE_CHECKING:
+    import pygame
+
+# Boards with a max_depth below this are drawn one square at a time, which is
+# faster when there are only a few squares. benchmark.report_raster_crossover
+# measures where the crossover is on a given machine.
+RASTER_MIN_DEPTH = 1
+
+
+def colour_grid(board: Block, max_cells: Optional[int] = None) \
+        -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Return a grid G of colour indices for <board> and the palette P of RGB
+    colours that they index.
+
+    G[i, j] is the index in P of the colour of the unit cell at column i and
+    row j, as in goal._flatten. P is block.PALETTE, so it starts with the
+    colours of COLOUR_LIST, in order, and G is made of the palette indices
+    that Blocks store.
+
+    If <max_cells> is given and <board> has more unit cells across than that,
+    G instead has the largest power of two cells across that is at most
+    <max_cells>, and the blocks covering one cell each take their dominant
+    colour.
+
+    Precondition: max_cells is None or max_cells >= 1
+    """
+    n = 2 ** (board.max_depth - board.level)
+    if max_cells is not None:
+        while n > max_cells:
+            n //= 2
+    grid = numpy.zeros((n, n), dtype=numpy.uint8)
+
+    # Each entry is a block and the column and row of its upper-left cell.
+    to_visit = [(board, 0, 0)]
+    while len(to_visit) > 0:
+        block, x, y = to_visit.pop()
+        cells = n // 2 ** (block.level - board.level)
+
+        if len(block.children) == 0:
+            grid[x:x + cells, y:y + cells] = block.colour_index
+        elif cells == 1:
+            grid[x, y] = palette_index(block.dominant_colour())
+        else:
+            half = cells // 2
+            to_visit.append((block.children[0], x + half, y))
+            to_visit.append((block.children[1], x, y))
+            to_visit.append((block.children[2], x, y + half))
+            to_visit.append((block.children[3], x + half, y + half))
+
+    return grid, numpy.array(PALETTE, dtype=numpy.uint8)
+
+
+def _cell_starts(start: int, size: int, depth: int) -> List[int]:
+    """Return the first pixel of each of the 2 ** <depth> unit cells across a
+    block that starts at pixel <start> and is <size> pixels wide, using the
+    same rounding as Block._child_size.
+    """
+    if depth == 0:
+        return [start]
+
+    half = round(size / 2.0)
+    return _cell_starts(start, half, depth - 1) + \
+        _cell_starts(start + half, half, depth - 1)
+
+
+@lru_cache(maxsize=16)
+def _pixel_counts(size: int, depth: int) -> numpy.ndarray:
+    """Return an array A where A[i] is the number of pixels across the unit
+    cell i of a board that is <size> pixels wide and has 2 ** <depth> unit
+    cells across.
+
+    Where rounding makes neighbouring cells overlap, the pixels in common go
+    to the later cell, and cells that start past the edge get no pixels.
+    """
+    starts = numpy.minimum(numpy.array(_cell_starts(0, size, depth)), size)
+    starts = numpy.maximum.accumulate(starts)
+
+    return numpy.diff(numpy.append(starts, size))
+
+
+def _scale_up(grid: numpy.ndarray, size: int) -> numpy.ndarray:
+    """Return <grid>, which has one entry per unit cell along its first two
+    axes, scaled up to one entry per pixel of a board that is <size> pixels
+    wide.
+    """
+    counts = _pixel_counts(size, grid.shape[0].bit_length() - 1)
+    # Scaling along the second axis first means the second repeat only has
+    # to copy whole rows, which is far faster.
+    return numpy.repeat(numpy.repeat(grid, counts, axis=1), counts, axis=0)
+
+
+def board_pixels(board: Block, by_row: bool = False) -> numpy.ndarray:
+    """Return the RGB pixels of <board> as an array A of shape
+    (board.size, board.size, 3), where A[x, y] is the colour of the pixel x
+    pixels right of and y pixels below the upper-left corner of <board>.
+
+    This is the layout that pygame.surfarray uses. If <by_row> is True, A is
+    indexed as A[y, x] instead, which is how image files store pixels.
+
+    Blocks smaller than a pixel are drawn with level of detail, as described
+    in colour_grid. Unless board.size is a multiple of 2 ** board.max_depth,
+    pixels along some block edges can differ from drawing one square at a
+    time, as the module description explains.
+    """
+    grid, palette = colour_grid(board, max(board.size, 1))
+    if by_row:
+        grid = grid.transpose()
+
+    return _scale_up(palette[grid], board.size)
+
+
+def draw_board(surface: pygame.Surface, board: Block) -> None:
+    """Draw <board> onto <surface> at the board's position.
+
+    Boards shallower than RASTER_MIN_DEPTH are drawn one square per
+    undivided block. Every other board is drawn with a single blit, with
+    level of detail for blocks smaller than a pixel, so the cost is bounded
+    by the number of pixels however deep the board is.
+    """
+    import pygame
+
+    if board.max_depth - board.level < RASTER_MIN_DEPTH:
+        to_visit = [board]
+        while len(to_visit) > 0:
+            block = to_visit.pop()
+            if len(block.children) == 0:
+                pygame.draw.rect(surface, block.colour,
+                                 (block.position[0], block.position[1],
+                                  block.size, block.size))
+            else:
+                to_visit.extend(block.children)
+    else:
+        grid, palette = colour_grid(board, max(board.size, 1))
+        # Scaling up the surface's own pixel values is much cheaper than
+        # scaling up RGB triples and converting them afterwards.
+        mapped = numpy.array([surface.map_rgb(tuple(colour))
+                              for colour in palette], dtype=numpy.uint32)
+        area = surface.subsurface((board.position[0], board.position[1],
+                                   board.size, board.size))
+        pygame.surfarray.blit_array(area, _scale_up(mapped[grid],
+                                                    board.size))
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', '__future__', 'functools',
+            'numpy', 'pygame', 'block'
+        ],
+        'generated-members': 'pygame.*'
+    })
@@ -0,0 +1,215 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains constant time queries about the colours in any rectangle
+of a board.
+
+A RegionCounts keeps, for each colour in COLOUR_LIST, a summed-area table: the
+number of unit cells of that colour above and to the left of every corner
+between unit cells. The number of cells of a colour in any rectangle then
+takes four lookups, and the dominant colour of a rectangle one lookup per
+colour, however large the rectangle is.
+
+Building the tables takes time proportional to the number of unit cells.
+After a move, update only rereads the cells of the Block that was acted on,
+and only changes the part of the tables below and to the right of it.
+"""
+from __future__ import annotations
+from typing import List, Tuple
+
+import numpy
+
+from block import Block
+from raster import colour_grid
+from settings import COLOUR_LIST
+
+# The column and row, in units of a child's width, of the upper-left cell of
+# each child of a Block, in the order the children are stored.
+_CHILD_OFFSETS = [(1, 0), (0, 0), (0, 1), (1, 1)]
+
+
+def _summed_areas(grid: numpy.ndarray) -> numpy.ndarray:
+    """Return an array S where S[c, i, j] is the number of entries in the
+    first i columns and the first j rows of <grid> that are c, for every
+    index c in COLOUR_LIST.
+
+    <grid> is indexed by column and then row, as raster.colour_grid gives it.
+    """
+    sums = numpy.zeros((len(COLOUR_LIST), grid.shape[0] + 1,
+                        grid.shape[1] + 1), dtype=numpy.int32)
+    for c in range(len(COLOUR_LIST)):
+        numpy.cumsum(numpy.cumsum(grid == c, axis=0, dtype=numpy.int32),
+                     axis=1, out=sums[c, 1:, 1:])
+
+    return sums
+
+
+class RegionCounts:
+    """The number of unit cells of each colour in every rectangle of a board.
+
+    A rectangle is given as a tuple (x, y, width, height) in unit cells, where
+    (x, y) is the column and row of its upper-left cell, counted from the
+    upper-left corner of the board.
+
+    === Public Attributes ===
+    board:
+        The board whose cells are counted.
+    """
+    # === Private Attributes ===
+    # _grid:
+    #     The index in block.PALETTE of the colour of every unit cell of
+    #     board, by column and then row.
+    # _sums:
+    #     _sums[c, i, j] is the number of unit cells of colour COLOUR_LIST[c]
+    #     in the first i columns and the first j rows of board.
+    board: Block
+    _grid: numpy.ndarray
+    _sums: numpy.ndarray
+
+    def __init__(self, board: Block) -> None:
+        """Initialize the counts of the colours of <board>.
+
+        This takes time proportional to the number of unit cells of <board>,
+        and the tables take 4 bytes per unit cell per colour in COLOUR_LIST.
+        """
+        self.board = board
+        self._grid = colour_grid(board)[0]
+        self._sums = _summed_areas(self._grid)
+
+    def block_rect(self, block: Block) -> Tuple[int, int, int, int]:
+        """Return the rectangle of unit cells that <block> covers.
+
+        The rectangle is worked out from the indices of the children that lead
+        from self.board to <block>, not from pixel positions, which rounding
+        makes unreliable on deep boards.
+
+        Precondition: <block> is self.board or one of its descendants.
+        """
+        x, y = 0, 0
+        cells = 2 ** (self.board.max_depth - self.board.level)
+
+        for index in block.path_from(self.board):
+            cells //= 2
+            x += _CHILD_OFFSETS[index][0] * cells
+            y += _CHILD_OFFSETS[index][1] * cells
+
+        return x, y, cells, cells
+
+    def counts(self, rect: Tuple[int, int, int, int]) -> List[int]:
+        """Return a list L where L[c] is the number of unit cells of colour
+        COLOUR_LIST[c] in the rectangle <rect>.
+
+        Precondition: <rect> lies within the board.
+        """
+        x, y, width, height = rect
+        end_x, end_y = x + width, y + height
+        sums = self._sums
+
+        return (sums[:, end_x, end_y] - sums[:, x, end_y] -
+                sums[:, end_x, y] + sums[:, x, y]).tolist()
+
+    def count(self, colour: Tuple[int, int, int],
+              rect: Tuple[int, int, int, int]) -> int:
+        """Return the number of unit cells of <colour> in the rectangle
+        <rect>, which is 0 for a colour that isn't in COLOUR_LIST.
+
+        Precondition: <rect> lies within the board.
+        """
+        if colour not in COLOUR_LIST:
+            return 0
+
+        sums = self._sums[COLOUR_LIST.index(colour)]
+        x, y, width, height = rect
+        end_x, end_y = x + width, y + height
+
+        return int(sums[end_x, end_y] - sums[x, end_y] - sums[end_x, y] +
+                   sums[x, y])
+
+    def dominant_colour(self, rect: Tuple[int, int, int, int]) \
+            -> Tuple[int, int, int]:
+        """Return the colour of the most unit cells in the rectangle <rect>,
+        choosing the one that comes first in COLOUR_LIST if there is a tie.
+
+        Precondition: <rect> lies within the board.
+        """
+        counts = self.counts(rect)
+        return COLOUR_LIST[counts.index(max(counts))]
+
+    def update(self, block: Block) -> None:
+        """Bring the counts up to date once a move has been done to <block>.
+
+        Only the unit cells of <block> are read again, and only the parts of
+        the tables below and to the right of its upper-left cell change.
+
+        Precondition: <block> is self.board or one of its descendants, and
+        the board hasn't changed anywhere else since the counts were last
+        brought up to date.
+
+        >>> board = Block((0, 0), 750, COLOUR_LIST[0], 0, 10)
+        >>> block = board
+        >>> while block.level < 10:
+        ...     _ = block.smash()
+        ...     block = block.children[3]
+        >>> counts = RegionCounts(board)
+        >>> block.colour = COLOUR_LIST[1] if block.colour == COLOUR_LIST[0] \\
+        ...     else COLOUR_LIST[0]
+        >>> counts.update(block)
+        >>> counts.block_rect(block)
+        (1023, 1023, 1, 1)
+        >>> fresh = RegionCounts(board)
+        >>> all(counts.counts(rect) == fresh.counts(rect) for rect in
+        ...     [(0, 0, 1024, 1024), (1000, 1000, 24, 24), (1023, 1023, 1, 1)])
+        True
+        """
+        x, y, width, _ = self.block_rect(block)
+        end_x, end_y = x + width, y + width
+
+        new = colour_grid(block)[0]
+        old = self._grid[x:end_x, y:end_y]
+        if numpy.array_equal(new, old):
+            return
+
+        # The summed areas of the change within the block. Beyond its right
+        # and bottom edges, the tables change by the totals of whole columns
+        # and rows of it.
+        delta = numpy.stack([(new == c).astype(numpy.int32) -
+                             (old == c).astype(numpy.int32)
+                             for c in range(len(COLOUR_LIST))])
+        delta = numpy.cumsum(numpy.cumsum(delta, axis=1), axis=2)
+
+        sums = self._sums
+        sums[:, x + 1:end_x + 1, y + 1:end_y + 1] += delta
+        sums[:, end_x + 1:, y + 1:end_y + 1] += delta[:, -1:, :]
+        sums[:, x + 1:end_x + 1, end_y + 1:] += delta[:, :, -1:]
+        sums[:, end_x + 1:, end_y + 1:] += delta[:, -1:, -1:]
+
+        self._grid[x:end_x, y:end_y] = new
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', '__future__', 'numpy', 'block',
+            'raster', 'settings'
+        ]
+    })
@@ -0,0 +1,395 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains an asyncio server that hosts many Blocky games at once.
+
+Clients connect over TCP or a Unix socket and send one JSON object per line.
+Every request gets exactly one JSON object per line back. The requests are:
+
+    {"op": "new", "max_depth": 3, "max_turns": 5, "num_human": 1,
+     "num_random": 1, "smart_players": [2]}
+        Start a new game and reply with its state.
+    {"op": "move", "game": 0, "action": "rotate", "direction": 1,
+     "position": [375, 0], "level": 1}
+        Do a move for the human player whose turn it is. The block acted on is
+        the one at <level> that includes <position>. Once the move is done,
+        every computer player whose turn follows moves as well, and the reply
+        holds the resulting state.
+    {"op": "state", "game": 0}
+        Reply with the state of a game.
+    {"op": "stats"}
+        Reply with the latency of every game and the number of games the
+        server can keep up with.
+
+A game's state holds its board as a list of [colour, position, size] squares,
+the turn, the id of the player to move, every player's score and, once the
+game is over, the winner.
+
+SmartPlayer and RandomPlayer moves are computed in a pool of worker processes,
+so one slow computer player never holds up the other games.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from block import Block, generate_board
+from blocky import GameData
+from moves import ACTIONS, encode, decode
+from player import Player, HumanPlayer, create_players, _get_block
+
+
+def _compute_move(board: Block, player: Player) -> int:
+    """Return the move that the computer <player> makes on <board>, encoded
+    by moves.encode.
+
+    This runs in a worker process on a copy of the game's board, so the Block
+    in the move can't be sent back as is.
+    """
+    player.proceed()
+    return encode(board, player.generate_move(board))
+
+
+class GameSession:
+    """One Blocky game hosted by the server.
+
+    === Public Attributes ===
+    id:
+        The number the clients use to refer to this game.
+    data:
+        The board, players and penalty counts of this game.
+    turn:
+        The current turn.
+    current_player_index:
+        The index of the player whose turn it is in data.players.
+    latencies:
+        The time, in seconds, that the server took to answer each move request
+        for this game, including the moves of the computer players that
+        followed it.
+    lock:
+        Held while a request is changing this game, so that requests for the
+        same game take effect one at a time.
+
+    === Representation Invariants ===
+    - 0 <= current_player_index < len(data.players)
+    """
+    id: int
+    data: GameData
+    turn: int
+    current_player_index: int
+    latencies: List[float]
+    lock: asyncio.Lock
+
+    def __init__(self, game_id: int, data: GameData) -> None:
+        """Initialize this game with the id <game_id> and the game <data>.
+        """
+        self.id = game_id
+        self.data = data
+        self.turn = 0
+        self.current_player_index = 0
+        self.latencies = []
+        self.lock = asyncio.Lock()
+
+    def current_player(self) -> Player:
+        """Return the player whose turn it is.
+        """
+        return self.data.players[self.current_player_index]
+
+    def is_over(self) -> bool:
+        """Return True iff every turn of this game has been played.
+        """
+        return self.turn >= self.data.max_turns
+
+    def do_move(self, move: Tuple[str, Optional[int], Block]) -> bool:
+        """Attempt to do <move> for the current player and, if it was done,
+        pass the turn on to the next player.
+
+        Return True iff the move was done.
+        """
+        if not self.data.apply_move(self.current_player(), move):
+            return False
+
+        self.current_player_index = (self.current_player_index + 1) % len(
+            self.data.players)
+        if self.current_player_index == 0:
+            self.turn += 1
+
+        return True
+
+    def state(self) -> Dict[str, Any]:
+        """Return the state of this game in a form that can be sent as JSON.
+        """
+        squares = []
+        to_visit = [self.data.board]
+        while len(to_visit) > 0:
+            block = to_visit.pop()
+            if len(block.children) == 0:
+                squares.append([block.colour, block.position, block.size])
+            else:
+                to_visit.extend(block.children)
+
+        scores = {}
+        for player in self.data.players:
+            goal_score, penalty = self.data.calculate_score(player.id)
+            scores[player.id] = goal_score - penalty
+
+        result = {'game': self.id, 'turn': self.turn,
+                  'player': self.current_player().id, 'board': squares,
+                  'scores': scores, 'over': self.is_over()}
+
+        if self.is_over():
+            result['winner'] = max(scores, key=lambda p: scores[p])
+
+        return result
+
+
+class BlockyServer:
+    """A server that hosts many Blocky games at once.
+
+    === Public Attributes ===
+    turn_budget:
+        The number of seconds that a game may take to answer one move request
+        and still count as being kept up with.
+    """
+    # === Private Attributes ===
+    # _games:
+    #   The games being hosted, by id.
+    # _executor:
+    #   The pool of processes that compute computer players' moves.
+    # _workers:
+    #   The number of processes in _executor.
+    # _peak_games:
+    #   The largest number of games that were in progress at the same time.
+    turn_budget: float
+    _games: Dict[int, GameSession]
+    _executor: Executor
+    _workers: int
+    _peak_games: int
+
+    def __init__(self, executor: Executor, workers: int,
+                 turn_budget: float = 1.0) -> None:
+        """Initialize this server, computing computer players' moves with the
+        <workers> processes of <executor>.
+        """
+        self.turn_budget = turn_budget
+        self._games = {}
+        self._executor = executor
+        self._workers = workers
+        self._peak_games = 0
+
+    async def handle_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of one client until it disconnects.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    reply = await self.handle_request(json.loads(line))
+                except (ValueError, KeyError, TypeError) as error:
+                    reply = {'error': str(error)}
+
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the reply to the decoded JSON <request>.
+
+        Raise a ValueError, KeyError or TypeError if <request> is malformed.
+        """
+        op = request['op']
+
+        if op == 'new':
+            return await self._new_game(request)
+        elif op == 'move':
+            return await self._move(request)
+        elif op == 'state':
+            return self._game(request).state()
+        elif op == 'stats':
+            return self.stats()
+        else:
+            raise ValueError(f'Unknown op: {op}')
+
+    def _game(self, request: Dict[str, Any]) -> GameSession:
+        """Return the game that <request> refers to.
+        """
+        game_id = request['game']
+        if game_id not in self._games:
+            raise ValueError(f'No game with id {game_id}')
+        return self._games[game_id]
+
+    async def _new_game(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Start the game described by <request> and return its state.
+        """
+        board = generate_board(request.get('max_depth', 3),
+                               request.get('size', 750))
+        players = create_players(request.get('num_human', 1),
+                                 request.get('num_random', 0),
+                                 request.get('smart_players', []))
+        data = GameData(board, players)
+        data.max_turns = request.get('max_turns', 5)
+
+        session = GameSession(len(self._games), data)
+        self._games[session.id] = session
+        self._peak_games = max(self._peak_games, self._games_in_progress())
+
+        async with session.lock:
+            await self._play_computer_turns(session)
+            return session.state()
+
+    async def _move(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Do the human player's move given in <request> and the computer
+        players' moves that follow it, and return the resulting state.
+        """
+        session = self._game(request)
+        start = time.perf_counter()
+
+        async with session.lock:
+            action = (request['action'], request.get('direction'))
+            if session.is_over():
+                raise ValueError('The game is over')
+            if not isinstance(session.current_player(), HumanPlayer):
+                raise ValueError('It is not a human player\'s turn')
+            if action not in ACTIONS:
+                raise ValueError(f'Unknown action: {action}')
+
+            position = request['position']
+            level = request['level']
+            if not isinstance(position, list) or len(position) != 2 or \
+                    not all(isinstance(p, int) for p in position) or \
+                    not isinstance(level, int) or level < 0:
+                raise ValueError('A move needs a position [x, y] and a level '
+                                 'of at least 0')
+
+            block = _get_block(session.data.board, tuple(position), level)
+            if block is None or not session.do_move((action[0], action[1],
+                                                     block)):
+                result = session.state()
+                result['error'] = 'Invalid move'
+                return result
+
+            await self._play_computer_turns(session)
+            result = session.state()
+
+        session.latencies.append(time.perf_counter() - start)
+        self._peak_games = max(self._peak_games, self._games_in_progress())
+        return result
+
+    async def _play_computer_turns(self, session: GameSession) -> None:
+        """Do the moves of the computer players in <session> until it is a
+        human player's turn or the game is over.
+        """
+        loop = asyncio.get_running_loop()
+
+        while not session.is_over() and \
+                not isinstance(session.current_player(), HumanPlayer):
+            code = await loop.run_in_executor(
+                self._executor, _compute_move, session.data.board,
+                session.current_player())
+            move = decode(session.data.board, code)
+
+            # The move was worked out on a copy of the current board, and the
+            # game has been locked since, so it can only fail because of a bug.
+            if move is None or not session.do_move(move):
+                raise ValueError(f'Player {session.current_player().id} made '
+                                 f'an invalid move')
+
+    def _games_in_progress(self) -> int:
+        """Return the number of hosted games that aren't over.
+        """
+        return sum(1 for game in self._games.values() if not game.is_over())
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the latency of every game and the capacity of this server.
+
+        The capacity is the number of games that could each have one move
+        request answered every <turn_budget> seconds, based on the mean time
+        taken to answer a move request so far.
+        """
+        games = {}
+        all_latencies = []
+        for game in self._games.values():
+            all_latencies.extend(game.latencies)
+            if len(game.latencies) > 0:
+                games[game.id] = {
+                    'moves': len(game.latencies),
+                    'mean_latency': sum(game.latencies) / len(game.latencies),
+                    'max_latency': max(game.latencies)
+                }
+            else:
+                games[game.id] = {'moves': 0}
+
+        if len(all_latencies) > 0:
+            mean_latency = sum(all_latencies) / len(all_latencies)
+            capacity = int(self.turn_budget * self._workers / mean_latency)
+        else:
+            capacity = None
+
+        return {'games': games, 'in_progress': self._games_in_progress(),
+                'peak_in_progress': self._peak_games, 'capacity': capacity}
+
+
+async def serve(host: str = '127.0.0.1', port: int = 8148,
+                unix_path: Optional[str] = None,
+                workers: Optional[int] = None) -> None:
+    """Host Blocky games on <host>:<port>, or on the Unix socket at
+    <unix_path> if it is given, until cancelled.
+
+    Computer players' moves are computed by <workers> processes, or by one
+    process per CPU if <workers> is None.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with ProcessPoolExecutor(workers) as executor:
+        server = BlockyServer(executor, workers)
+
+        if unix_path is not None:
+            listener = await asyncio.start_unix_server(server.handle_client,
+                                                       unix_path)
+        else:
+            listener = await asyncio.start_server(server.handle_client, host,
+                                                  port)
+
+        async with listener:
+            await listener.serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Host Blocky games.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8148)
+    parser.add_argument('--unix', help='serve on this Unix socket instead')
+    parser.add_argument('--workers', type=int,
+                        help='processes for computer players (default: CPUs)')
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.host, args.port, args.unix, args.workers))
@@ -0,0 +1,533 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains a way to share a board with worker processes without
+pickling it.
+
+A SharedBoard publishes a board into a block of shared memory, as an array of
+fixed-size node records and a grid with the colour of every unit cell. Any
+process can open a BoardView of it by the name of the shared memory, without
+anything being copied or unpickled, and read it through BlockViews. A
+BlockView has the parts of Block's interface that only read the board, so it
+can be scored by Goal.score, checked for the actions that can be done to it
+by player._block_actions and copied into a Block with create_copy to try a
+move on.
+
+After a move, the owner publishes the board again, and only the Block that
+the move was done to is written out. Its own node record is rewritten in
+place, the records of its descendants are added after all the others, and
+only its unit cells are written to the grid. The records its old descendants
+had are left unused until the records outgrow the shared memory, when the
+whole board is written out again without them.
+"""
+from __future__ import annotations
+import random
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional, Tuple
+
+import numpy
+
+from block import Block, PALETTE
+from goal import Goal
+from moves import resolve, unpack
+from player import _do_action
+from settings import COLOUR_LIST
+
+# The layout of a node record. Each Block has the pixel position and size of
+# its upper-left corner, the column and row of its upper-left unit cell and
+# its level. A leaf has the index in COLOUR_LIST of its colour and -1 for
+# child. Any other Block has -1 for colour, and its four children are stored
+# in order from the record numbered child.
+NODE = numpy.dtype([('x', '<i4'), ('y', '<i4'), ('size', '<i4'),
+                    ('column', '<i4'), ('row', '<i4'), ('level', '<i1'),
+                    ('colour', '<i2'), ('child', '<i4')])
+
+# The entries of the header at the start of the shared memory: the board's
+# max_depth, the number of node records, the number there is room for, the
+# number of unit cells across the board and the number of times it has been
+# published.
+_MAX_DEPTH, _NODES, _CAPACITY, _CELLS, _VERSION = range(5)
+_HEADER_SIZE = 8
+
+# The index of the child in each quarter of a Block, by whether it is in the
+# bottom half and then whether it is in the right half.
+_CHILD_INDICES = [[1, 0], [2, 3]]
+
+
+def _node_records(top: Block, column: int, row: int,
+                  start: int) -> numpy.ndarray:
+    """Return the node records of <top> and its descendants, with every
+    Block's children stored together, starting with <top> itself.
+
+    The upper-left unit cell of <top> is at <column> and <row> of the board.
+    The descendants' records are numbered from <start>, in order, so the
+    record of <top> is the only one that can be stored anywhere else.
+
+    Precondition: every colour in <top> is in COLOUR_LIST.
+    """
+    records = []
+    # Each entry is a Block and the column and row of its upper-left cell.
+    to_record = [(top, column, row)]
+
+    for block, column, row in to_record:
+        if len(block.children) == 0:
+            child = -1
+            colour = block.colour_index
+        else:
+            child = start + len(to_record) - 1
+            colour = -1
+            half = 2 ** (top.max_depth - block.level - 1)
+            to_record.append((block.children[0], column + half, row))
+            to_record.append((block.children[1], column, row))
+            to_record.append((block.children[2], column, row + half))
+            to_record.append((block.children[3], column + half, row + half))
+
+        records.append((block.position[0], block.position[1], block.size,
+                        column, row, block.level, colour, child))
+
+    return numpy.array(records, dtype=NODE)
+
+
+def _grid_offset(capacity: int) -> int:
+    """Return the offset, in bytes, of the grid in shared memory with room
+    for <capacity> node records.
+    """
+    return _HEADER_SIZE * 8 + capacity * NODE.itemsize
+
+
+class SharedBoard:
+    """A board published in shared memory for BoardViews to read.
+
+    === Public Attributes ===
+    board:
+        The board that is published.
+    name:
+        The name of the shared memory the board is published in, which
+        changes when the board outgrows it.
+    """
+    # === Private Attributes ===
+    # _memory:
+    #     The shared memory the board is published in.
+    board: Block
+    name: str
+    _memory: Optional[SharedMemory]
+
+    def __init__(self, board: Block) -> None:
+        """Publish <board> in new shared memory.
+
+        Precondition: every colour on <board> is in COLOUR_LIST.
+        """
+        self.board = board
+        self._memory = None
+        self.publish()
+
+    def publish(self, block: Optional[Block] = None) -> None:
+        """Publish the board again once a move has been done to <block>, or
+        the whole board if <block> is None.
+
+        No BoardView of the board may be in use while it is published.
+
+        Precondition: <block> is the board or one of its descendants, and the
+        board hasn't changed anywhere else since it was last published.
+        """
+        if self._memory is None or block is None:
+            self._publish_all()
+            return
+
+        header = self._header()
+        nodes = self._nodes(int(header[_CAPACITY]))
+        index = 0
+        for child in block.path_from(self.board):
+            index = int(nodes[index]['child']) + child
+
+        start = int(header[_NODES])
+        records = _node_records(block, int(nodes[index]['column']),
+                                int(nodes[index]['row']), start)
+        if start + len(records) - 1 > header[_CAPACITY]:
+            # The shared memory can't be closed while arrays use it.
+            del nodes, header
+            self._publish_all()
+            return
+
+        nodes[index] = records[0]
+        nodes[start:start + len(records) - 1] = records[1:]
+        header[_NODES] = start + len(records) - 1
+        header[_VERSION] += 1
+        self._write_cells(block, int(records[0]['column']),
+                          int(records[0]['row']))
+
+    def _publish_all(self) -> None:
+        """Publish the whole board, moving it to new shared memory if it has
+        outgrown the memory it is in.
+        """
+        nodes = _node_records(self.board, 0, 0, 1)
+        cells = 2 ** (self.board.max_depth - self.board.level)
+
+        if self._memory is None or \
+                len(nodes) > self._header()[_CAPACITY]:
+            # Leave room for the board to grow before it has to move again.
+            capacity = 2 * len(nodes)
+            memory = SharedMemory(create=True, size=_grid_offset(capacity) +
+                                  cells * cells)
+            if self._memory is not None:
+                version = self._header()[_VERSION]
+                self.close()
+            else:
+                version = 0
+
+            self._memory = memory
+            self.name = memory.name
+            header = self._header()
+            header[_MAX_DEPTH] = self.board.max_depth
+            header[_CAPACITY] = capacity
+            header[_CELLS] = cells
+            header[_VERSION] = version
+
+        header = self._header()
+        header[_NODES] = len(nodes)
+        header[_VERSION] += 1
+        offset = _HEADER_SIZE * 8
+        self._memory.buf[offset:offset + nodes.nbytes] = nodes.tobytes()
+        self._write_cells(self.board, 0, 0)
+
+    def _nodes(self, capacity: int) -> numpy.ndarray:
+        """Return the <capacity> node records there is room for in the
+        shared memory, to be written to.
+        """
+        return numpy.ndarray((capacity,), dtype=NODE, buffer=self._memory.buf,
+                             offset=_HEADER_SIZE * 8)
+
+    def _write_cells(self, block: Block, column: int, row: int) -> None:
+        """Write the unit cells of <block>, whose upper-left unit cell is at
+        <column> and <row> of the board, to the grid.
+        """
+        header = self._header()
+        cells = int(header[_CELLS])
+        offset = _grid_offset(int(header[_CAPACITY]))
+
+        for i, cells_column in enumerate(block.colour_columns()):
+            start = offset + (column + i) * cells + row
+            self._memory.buf[start:start + len(cells_column)] = cells_column
+
+    def version(self) -> int:
+        """Return the number of times the board has been published.
+        """
+        return int(self._header()[_VERSION])
+
+    def _header(self) -> numpy.ndarray:
+        """Return the header at the start of the shared memory.
+        """
+        return numpy.ndarray((_HEADER_SIZE,), dtype=numpy.int64,
+                             buffer=self._memory.buf)
+
+    def close(self) -> None:
+        """Free the shared memory the board is published in.
+        """
+        self._memory.close()
+        self._memory.unlink()
+        self._memory = None
+
+
+class BoardView:
+    """A read-only view of a board published by a SharedBoard, from any
+    process.
+
+    The view shows the board as it was when the view was opened.
+
+    === Public Attributes ===
+    root:
+        The view of the whole board.
+    version:
+        The number of times the board had been published when this view was
+        opened.
+    max_depth:
+        The max_depth of the board.
+    """
+    # === Private Attributes ===
+    # _memory:
+    #     The shared memory the board is published in.
+    # _nodes:
+    #     The node records of the board.
+    # _grid:
+    #     The index in COLOUR_LIST of the colour of every unit cell of the
+    #     board, by column and then row.
+    # _cells:
+    #     The number of unit cells across the board.
+    root: BlockView
+    version: int
+    max_depth: int
+    _memory: SharedMemory
+    _nodes: numpy.ndarray
+    _grid: memoryview
+    _cells: int
+
+    def __init__(self, name: str) -> None:
+        """Open a view of the board published in the shared memory called
+        <name>.
+        """
+        self._memory = SharedMemory(name)
+        header = numpy.ndarray((_HEADER_SIZE,), dtype=numpy.int64,
+                               buffer=self._memory.buf).tolist()
+
+        self.max_depth = header[_MAX_DEPTH]
+        self.version = header[_VERSION]
+        self._cells = header[_CELLS]
+        self._nodes = numpy.ndarray((header[_NODES],), dtype=NODE,
+                                    buffer=self._memory.buf,
+                                    offset=_HEADER_SIZE * 8)
+        self._nodes.flags.writeable = False
+
+        offset = _grid_offset(header[_CAPACITY])
+        self._grid = self._memory.buf[offset:offset + self._cells ** 2] \
+            .toreadonly()
+        self.root = BlockView(self, 0)
+
+    def close(self) -> None:
+        """Close this view. Neither it nor its BlockViews may be used
+        afterwards.
+        """
+        del self._nodes
+        self._grid.release()
+        self._memory.close()
+
+
+class BlockView:
+    """A read-only view of one Block of a board published by a SharedBoard.
+
+    It has the attributes of a Block, and the methods of a Block that only
+    read it. Each BlockView's children are only made once, so, as with
+    Blocks, views of the same Block found the same way are the same object.
+
+    === Public Attributes ===
+    position:
+        The (x, y) coordinates of the upper left corner of this Block.
+    size:
+        The height and width of this Block.
+    level:
+        The level of this Block in the board.
+    max_depth:
+        The deepest level allowed in the board.
+    colour_index:
+        The index in block.PALETTE of this Block's colour, or None if it has
+        children.
+    """
+    # === Private Attributes ===
+    # _board:
+    #     The view of the board this Block belongs to.
+    # _column:
+    #     The column of this Block's upper-left unit cell in the board.
+    # _row:
+    #     The row of this Block's upper-left unit cell in the board.
+    # _first_child:
+    #     The number of the node record of this Block's first child, or -1 if
+    #     it has no children.
+    # _children:
+    #     The views of this Block's children, or None if they haven't been
+    #     made yet.
+    position: Tuple[int, int]
+    size: int
+    level: int
+    max_depth: int
+    colour_index: Optional[int]
+    _board: BoardView
+    _column: int
+    _row: int
+    _first_child: int
+    _children: Optional[List[BlockView]]
+
+    def __init__(self, board: BoardView, index: int) -> None:
+        """Initialize a view of the Block in node record <index> of <board>.
+        """
+        x, y, size, column, row, level, colour, child = \
+            board._nodes[index].tolist()
+
+        self.position = (x, y)
+        self.size = size
+        self.level = level
+        self.max_depth = board.max_depth
+        self.colour_index = None if colour < 0 else colour
+        self._board = board
+        self._column = column
+        self._row = row
+        self._first_child = child
+        self._children = None
+
+    @property
+    def colour(self) -> Optional[Tuple[int, int, int]]:
+        """The colour of this Block if it is not subdivided, otherwise None.
+        """
+        if self.colour_index is None:
+            return None
+        return PALETTE[self.colour_index]
+
+    @property
+    def children(self) -> List[BlockView]:
+        """The views of this Block's children, in the order a Block stores
+        them.
+        """
+        if self._children is None:
+            if self._first_child < 0:
+                self._children = []
+            else:
+                self._children = [BlockView(self._board, self._first_child + i)
+                                  for i in range(4)]
+
+        return self._children
+
+    def path_from(self, ancestor: BlockView) -> List[int]:
+        """Return the indices of the children to follow from <ancestor> to
+        reach this Block, as Block.path_from does.
+
+        The path is read off the unit cells the two Blocks start at.
+
+        Precondition: <ancestor> is this Block or one of its ancestors.
+        """
+        path = []
+        column = self._column - ancestor._column
+        row = self._row - ancestor._row
+        half = ancestor._unit_cells_across()
+
+        for _ in range(self.level - ancestor.level):
+            half //= 2
+            right = column >= half
+            below = row >= half
+            path.append(_CHILD_INDICES[below][right])
+            column -= half * right
+            row -= half * below
+
+        return path
+
+    def _unit_cells_across(self) -> int:
+        """Return the number of unit cells across this Block.
+        """
+        return 2 ** (self.max_depth - self.level)
+
+    def colour_columns(self) -> List[memoryview]:
+        """Return this Block as columns of unit cells, as Block.colour_columns
+        does, read straight from shared memory.
+        """
+        n = self._board._cells
+        across = self._unit_cells_across()
+        starts = [(self._column + i) * n + self._row for i in range(across)]
+
+        return [self._board._grid[start:start + across] for start in starts]
+
+    def colour_count(self, colour: Tuple[int, int, int]) -> int:
+        """Return the number of unit cells of <colour> in this Block.
+        """
+        if colour not in COLOUR_LIST:
+            return 0
+
+        n = self._board._cells
+        across = self._unit_cells_across()
+        grid = numpy.frombuffer(self._board._grid, dtype=numpy.uint8)
+        cells = grid.reshape(n, n)[self._column:self._column + across,
+                                   self._row:self._row + across]
+
+        return int(numpy.count_nonzero(cells == COLOUR_LIST.index(colour)))
+
+    def dominant_colour(self) -> Optional[Tuple[int, int, int]]:
+        """Return the colour of the most unit cells in this Block, choosing the
+        one that comes first in COLOUR_LIST if there is a tie.
+        """
+        if len(self.children) == 0:
+            return self.colour
+
+        counts = [self.colour_count(colour) for colour in COLOUR_LIST]
+        return COLOUR_LIST[counts.index(max(counts))]
+
+    def smashable(self) -> bool:
+        """Return True iff this Block can be smashed.
+        """
+        return self.level != self.max_depth and len(self.children) == 0
+
+    def combinable(self) -> bool:
+        """Return True iff this Block can be combined.
+        """
+        if len(self.children) == 0 or self.level != self.max_depth - 1:
+            return False
+
+        counts = [0] * len(COLOUR_LIST)
+        for child in self.children:
+            counts[child.colour_index] += 1
+        return counts.count(max(counts)) == 1
+
+    def create_copy(self) -> Block:
+        """Return a Block with the same position, size, colours and structure
+        as this Block, which moves can be done to.
+        """
+        copy = Block(self.position, self.size, self.colour, self.level,
+                     self.max_depth)
+
+        to_copy = [(self, copy)]
+        while len(to_copy) > 0:
+            view, block = to_copy.pop()
+            if len(view.children) > 0:
+                children = [Block(child.position, child.size, child.colour,
+                                  child.level, child.max_depth)
+                            for child in view.children]
+                block.set_children(children)
+                to_copy.extend(zip(view.children, children))
+
+        return copy
+
+
+def score_moves(name: str, goal: Goal, codes: List[int],
+                seed: Optional[int] = None) -> List[int]:
+    """Return the score of <goal> on the board published in the shared memory
+    called <name> once each move in <codes>, encoded by moves.encode, has
+    been done to it on its own.
+
+    If <seed> is given, a smash draws from a generator seeded from <seed> and
+    its own code, so its score doesn't depend on which worker scores it or
+    what else that worker scores. Otherwise smashes use the random module.
+
+    This can run in a worker process: only <name>, <goal>, <codes> and <seed>
+    are sent to it.
+    """
+    view = BoardView(name)
+    scores = []
+
+    try:
+        for code in codes:
+            action, path = unpack(code)
+            copy = view.root.create_copy()
+            block = resolve(copy, path)
+            rng = None if seed is None else random.Random(f'{seed}/{code}')
+            _do_action(block, action, goal.colour, rng)
+            scores.append(goal.score(copy))
+    finally:
+        view.close()
+
+    return scores
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__', 'numpy',
+            'multiprocessing.shared_memory', 'block', 'goal', 'moves',
+            'player', 'settings'
+        ],
+        'max-attributes': 10
+    })
@@ -0,0 +1,105 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the random number generators that one game draws from.
+
+generate_board, Block.smash, generate_goals and the computer players all take
+an optional random.Random to draw from, and use the random module when they
+aren't given one. A GameStreams gives each of them its own generator, seeded
+from the game's seed and the name of what it is used for. Nothing that one of
+them draws changes what another one draws, and no generator is shared with
+any other game or with the random module.
+
+A game played from the same seed is then the same game, move for move, in any
+process, however many other games are played alongside it.
+"""
+from __future__ import annotations
+import random
+from typing import Dict
+
+
+class GameStreams:
+    """The random number generators of one game.
+
+    === Public Attributes ===
+    seed:
+        The seed that every generator of the game is derived from.
+    board:
+        The generator that the board is generated with.
+    goals:
+        The generator that the players' goals are generated with.
+    smashes:
+        The generator that the blocks smashed by the players' moves draw
+        their children from.
+    """
+    # === Private Attributes ===
+    # _players:
+    #     The generator of each player that has been asked for, by player id.
+    seed: int
+    board: random.Random
+    goals: random.Random
+    smashes: random.Random
+    _players: Dict[int, random.Random]
+
+    def __init__(self, seed: int) -> None:
+        """Initialize the generators of the game played from <seed>.
+        """
+        self.seed = seed
+        self.board = self.stream('board')
+        self.goals = self.stream('goals')
+        self.smashes = self.stream('smashes')
+        self._players = {}
+
+    def stream(self, name: str) -> random.Random:
+        """Return a new generator seeded from this game's seed and <name>.
+
+        Seeding from a string hashes it with SHA-512, so generators with
+        different names are independent, and the same name always gives the
+        same generator in every process.
+
+        >>> GameStreams(3).stream('a').random() == \\
+        ...     GameStreams(3).stream('a').random()
+        True
+        >>> GameStreams(3).stream('a').random() == \\
+        ...     GameStreams(3).stream('b').random()
+        False
+        """
+        return random.Random(f'{self.seed}/{name}')
+
+    def player(self, player_id: int) -> random.Random:
+        """Return the generator that the player with id <player_id> makes its
+        moves with.
+
+        The same generator is returned every time for the same player.
+        """
+        if player_id not in self._players:
+            self._players[player_id] = self.stream(f'player {player_id}')
+        return self._players[player_id]
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__'
+        ]
+    })